@@ -83,763 +83,2627 @@ EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 
-import inspect, re, sys, types
+import cPickle, hashlib, inspect, itertools, operator, os, re, sys, threading, time, timeit, types
 
 
 ################ Constant variables
 SIFTER_VERSION = '1.0107'
 SIFTER_PACKAGE = 'Sifter'
 
-SIFTER_AVAILABLE_CONTROLS = r'LOOP|FOR|IF|ELSE|EMBED|NOBREAK|LITERAL|INCLUDE|\?'
+SIFTER_AVAILABLE_CONTROLS = r'LOOP|FOR|IF|ELSE|EMBED|NOBREAK|LITERAL|INCLUDE|BLOCK|CACHE|\?'
 SIFTER_CONTROL_EXPRESSION = r'((END_)?(' + SIFTER_AVAILABLE_CONTROLS + r'))(?:\((.*?)\))?'
 SIFTER_DECIMAL_EXPRESSION = r'-?(?:\d*?\.\d+|\d+\.?)'
 SIFTER_REPLACE_EXPRESSION = r'(#?[A-Za-z_]\w*?)(\s*[\+\-\*\/%]\s*' + SIFTER_DECIMAL_EXPRESSION + r')?(,\d*)?((?:\:|\/)\w+)?'
 SIFTER_TAG_EXPRESSION = r'(?:[^\"\'>]|\"[^\"]*\"|\'[^\']*\')'
 SIFTER_EMBED_EXPRESSION = r'<(?:input|\/?select)' + SIFTER_TAG_EXPRESSION + r'*>|<option' + SIFTER_TAG_EXPRESSION + r'*>.*?(?:<\/option>|[\r\n])|<textarea' + SIFTER_TAG_EXPRESSION + r'*>.*?<\/textarea>'
 SIFTER_CONDITIONAL_EXPRESSION = r'((?:[^\'\?]+|(?:\'(?:\\.|[^\'])*?\'))+)\?\s*((?:\\.|[^:])*)\s*:\s*(.*)'
+SIFTER_UNDEFINED = object()
+SIFTER_HTML_SPECIAL_CHARS = re.compile(r'[&"<>]')
+SIFTER_EMBED_PATTERN = re.compile(SIFTER_EMBED_EXPRESSION, re.I|re.S)
+SIFTER_DECIMAL_PATTERN = re.compile(SIFTER_DECIMAL_EXPRESSION)
+SIFTER_NUMBER_PATTERN = re.compile(r'^' + SIFTER_DECIMAL_EXPRESSION + r'$')
+SIFTER_OPERATORS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.div, '%': operator.mod}
 
 
 ################ Global variables
+# Default tag characters, which set_control_tag() and set_replace_tag() override per Sifter object
 SIFTER_CONTROL_TAG_BGN = r'<!--@'
 SIFTER_CONTROL_TAG_END = r'-->'
-SIFTER_CONTROL_PATTERN = r'^(.*?)(' + SIFTER_CONTROL_TAG_BGN + SIFTER_CONTROL_EXPRESSION + SIFTER_CONTROL_TAG_END + r')(.*)$'
 SIFTER_REPLACE_TAG_BGN = r'\{'
 SIFTER_REPLACE_TAG_END = r'\}'
-SIFTER_REPLACE_PATTERN = SIFTER_REPLACE_TAG_BGN + SIFTER_REPLACE_EXPRESSION + SIFTER_REPLACE_TAG_END
 
-SIFTER_SELECT_NAME = ''
 SIFTER_DEBUG = None
+SIFTER_CACHE_SIZE = 128
+SIFTER_FRAGMENT_CACHE_SIZE = 1024
 
 
 ################ Classes
-class SifterElement:
+class SifterSyntax:
 	"""
-	Template element class
+	Template syntax class
 	
 	@package	Sifter
 	"""
 
 	######## Constructor
-	def __init__(self, parent, type='', param='', embed_flag=0, nobreak_flag=0):
+	def __init__(self, control_tag_bgn=SIFTER_CONTROL_TAG_BGN, control_tag_end=SIFTER_CONTROL_TAG_END, replace_tag_bgn=SIFTER_REPLACE_TAG_BGN, replace_tag_end=SIFTER_REPLACE_TAG_END):
 		"""
-		Creates new SifterElement object
+		Creates new SifterSyntax object
 		
 		@return	object
-		@param	object	parent        Parent object
-		@param	string	type          Type of this object
-		@param	string	param         Parameter string
-		@param	int		embed_flag    Embed flag
-		@param	int		nobreak_flag  No-break flag
+		@param	string	control_tag_bgn  Control tag characters (begin)
+		@param	string	control_tag_end  Control tag characters (end)
+		@param	string	replace_tag_bgn  Replace tag characters (begin)
+		@param	string	replace_tag_end  Replace tag characters (end)
 		"""
 
 		######## Members
 		##
-		# Holds top level object
-		# 
-		# @var	object
-		##
-		self.top = None
-
-		##
-		# Holds template object
-		# 
-		# @var	object
-		##
-		self.template = None
-
-		##
-		# Holds parent object
+		# Control tag characters (begin)
 		# 
-		# @var	object
+		# @var	string
 		##
-		self.parent = None
+		self.control_tag_bgn = control_tag_bgn
 
 		##
-		# Type of this object
+		# Control tag characters (end)
 		# 
 		# @var	string
 		##
-		self.type = ''
+		self.control_tag_end = control_tag_end
 
 		##
-		# Parameter string
+		# Replace tag characters (begin)
 		# 
 		# @var	string
 		##
-		self.param = ''
+		self.replace_tag_bgn = replace_tag_bgn
 
 		##
-		# Holds child objects
+		# Replace tag characters (end)
 		# 
-		# @var	array
+		# @var	string
 		##
-		self.contents = []
+		self.replace_tag_end = replace_tag_end
 
 		##
-		# Count child objects
+		# Regular expression of replace tag
 		# 
-		# @var	int
+		# @var	string
 		##
-		self.content_index = -1
+		self.replace_expression = replace_tag_bgn + SIFTER_REPLACE_EXPRESSION + replace_tag_end
 
 		##
-		# Embed flag
+		# Compiled pattern of control tag
 		# 
-		# @var	int
+		# @var	object
 		##
-		self.embed_flag = 0
+		self.control_pattern = re.compile(control_tag_bgn + SIFTER_CONTROL_EXPRESSION + control_tag_end, re.S)
 
 		##
-		# No-break flag
+		# Compiled pattern of replace tag
 		# 
-		# @var	int
+		# @var	object
 		##
-		self.nobreak_flag = 0
+		self.replace_pattern = re.compile(self.replace_expression)
 
 		##
-		# Result of previous evaluation of condition
+		# Key to identify this syntax
 		# 
-		# @var	bool
+		# @var	tuple
 		##
-		self.prev_eval_result = True
-
-		if not parent: return None
-
-		if parent._get_top():
-			self.top = parent._get_top()
-		else:
-			self.top = parent
-
-		if parent._get_template():
-			self.template = parent._get_template()
-		else:
-			self.template = parent
-
-		self.parent = parent
-		self.type = type
-		self.param = param
-
-		self.embed_flag   = embed_flag
-		self.nobreak_flag = nobreak_flag
+		self.key = (control_tag_bgn, control_tag_end, replace_tag_bgn, replace_tag_end)
 
 	######## Methods
-	def _get_top(self):
+	def __getstate__(self):
 		"""
-		Returns reference to top level object
+		Returns state to be pickled
 		
-		@return	object	Reference to top level object
+		@return	tuple	Control tag and replace tag characters
 		"""
-		return self.top
+		return self.key
 
-	def _get_template(self):
+	def __setstate__(self, state):
 		"""
-		Returns reference to template object
+		Restores unpickled state
 		
-		@return	object	Reference to template object
+		@param	tuple	state  Control tag and replace tag characters
 		"""
-		return self.template
+		self.__init__(*state)
 
-	def _get_parent(self):
+
+class SifterScope(object):
+	"""
+	Replacement scope class
+	
+	@package	Sifter
+	"""
+
+	__slots__ = ('names', 'rows', 'escaped', 'resolved', 'peeked', 'state')
+
+	######## Constructor
+	def __init__(self, parent, row=None, name='', value=None, escape=False):
 		"""
-		Returns reference to parent object
+		Creates new SifterScope object
 		
-		@return	object	Reference to parent object
-		"""
-		return self.parent
+		@return	object
+		@param	mixed	parent  Array of replacement or SifterScope object of outer block, or None
+		@param	array	row     Array of replacement of current row
+		@param	string	name    Name of loop variable
+		@param	mixed	value   Value of loop variable
+		@param	mixed	escape  If this parameter is True, HTML entities in the row are converted on output.
+		                        If this parameter is an array, only the variables named in it are converted
+		"""
+
+		if parent.__class__ is SifterScope:
+			# Members are shared with scope of outer block
+			self.names = parent.names
+			self.rows = parent.rows
+			self.escaped = parent.escaped
+			self.resolved = parent.resolved
+			self.peeked = parent.peeked
+			self.state = parent.state
+		else:
+			######## Members
+			##
+			# Loop variables of this and outer blocks
+			# 
+			# @var	array
+			##
+			self.names = {}
+
+			##
+			# Pairs of array of replacement and escape flag, from outermost block to current row
+			# 
+			# @var	tuple
+			##
+			self.rows = ((parent, False),) if parent is not None else ()
+
+			##
+			# Holds strings whose HTML entities are already converted, and pairs of array and its converted copy keyed by id of array
+			# 
+			# @var	array
+			##
+			self.escaped = {}
+
+			##
+			# Holds pairs of row and value returned by callable replacements, keyed by pairs of id of row and name
+			# 
+			# @var	array
+			##
+			self.resolved = {}
+
+			##
+			# Holds iterators of LOOP blocks whose first row is already read, keyed by id of the source
+			# 
+			# @var	array
+			##
+			self.peeked = {}
+
+			##
+			# Holds state of rendering, such as name of select element being embedded
+			# 
+			# @var	array
+			##
+			self.state = {}
+
+		if name != '':
+			self.names = self.names.copy()
+			self.names[name] = value
+
+		if row is not None:
+			self.rows = self.rows + ((row, escape),)
 
-	def _parse(self):
+	######## Methods
+	def _find(self, key):
 		"""
-		Reads and parses template file
+		Returns replacement specified by key without converting HTML entities
 		
-		@return	bool
-		"""
-		literal = (self.type == 'LITERAL')
-
-		regexp = re.compile(SIFTER_CONTROL_PATTERN, re.S)
-		i = 0
-		while self.template.buffer != '' or self.template._read_line():
-			matches = regexp.search(self.template.buffer)
-			if matches:
-				matches = (None,) + matches.groups()
-			if not matches:
-				# Text
-				self._append_text(self.template.buffer)
-				self.template.buffer = ''
-				continue
-
-			if literal and matches[3] != 'END_LITERAL':
-				# LITERAL block
-				self._append_text(matches[1] + matches[2])
-				self.template.buffer = matches[7]
-				self.template._set_preserve_spaces_flag(True)
-				continue
-
-			if matches[1] is not None and matches[7] is not None and re.search(r'[^\s]', matches[1] + matches[7]):
-				self._append_text(matches[1])
-				self.template.buffer = matches[7]
-				self.template._set_preserve_spaces_flag(True)
-			elif self.template._get_preserve_spaces_flag() or matches[3] == 'END_NOBREAK':
-				self._append_text(re.sub(r'[^\r\n]', '', matches[1]))
-				self.template.buffer = re.sub(r'[^\r\n]', '', matches[7])
-			else:
-				self.template.buffer = ''
-
-			type_ = matches[5] if matches[5] else ''
-			param = re.sub(r'^\s+|\s+$', '', matches[6]) if matches[6] else ''
-
-			if matches[4]:
-				# End of block
-				if param == '' and (self.type == type_ or (self.type == 'ELSE' and (type_ == 'IF' or type_ == 'LOOP'))):
-					return True
-				else:
-					self.template._raise_error(inspect.getlineno(sys._getframe())+1)
-					return False
-
-			if (type_ == 'LOOP' or type_ == 'FOR') and param != '':
-				# LOOP, FOR block
-				if not self._append_element(type_, param):
-					return False
-			elif type_ == 'IF' and param != '':
-				# IF block
-				param = Sifter._check_condition(param)
-				if not param:
-					return False
-				if not self._append_element(type_, param):
-					return False
-			elif type_ == 'ELSE':
-				# ELSE block
-				if self.type == 'LOOP' and param == '':
-					if not self.parent._append_element(type_, param):
-						return False
-					break
-				elif self.type == 'IF' or self.type == 'ELSE':
-					param = Sifter._check_condition(param)
-					if param != '' and not param:
-						self.template._raise_error(inspect.getlineno(sys._getframe())+1)
-						return False
-					if not self.parent._append_element(type_, param):
-						return False
-					break
-				else:
-					self.template._raise_error(inspect.getlineno(sys._getframe())+1)
-					return False
-			elif type_ == '?' and param != '':
-				# ?
-				condition = False
-				matches = re.compile(SIFTER_CONDITIONAL_EXPRESSION).search(param)
-				if matches:
-					matches = (None,) + matches.groups()
-					condition = Sifter._check_condition(matches[1])
-				if not condition:
-					self.template._raise_error(inspect.getlineno(sys._getframe())+1)
-					return False
-				if not self._append_element('IF', condition, True, re.sub(r'\\(.)', r'\1', matches[2])):
-					return False
-				if not self._append_element('ELSE', '', True, re.sub(r'\\(.)', r'\1', matches[3])):
-					return False
-			elif type_ == 'EMBED':
-				# EMBED block
-				param = param.lower()
-				if param == '' or param == 'xml' or param == 'html':
-					if not self._append_element(type_, 1 if param == 'html' else 3):
-						return False
-				else:
-					self.template._raise_error(inspect.getlineno(sys._getframe())+1)
-					return False
-			elif (type_ == 'NOBREAK' or type_ == 'LITERAL') and param == '':
-				# NOBREAK, LITERAL block
-				if not self._append_element(type_, ''):
-					return False
-			elif type_ == 'INCLUDE' and param != '':
-				# INCLUDE
-				if not self._append_template(param):
-					return False
-			else:
-				# Syntax error
-				self.template._raise_error(inspect.getlineno(sys._getframe())+1)
-				return False
+		Loop variables precede replacements of outer blocks, which precede replacements of inner rows.
+		"#name_count" is computed from the row when it is not set explicitly.
+		Callable replacements are called when they are referred first in the rendering.
+		
+		@return	tuple	Pair of replacement (SIFTER_UNDEFINED if it does not exist) and escape flag
+		@param	string	key  Name of variable
+		"""
+		if key in self.names:
+			return (self.names[key], False)
+
+		count = (key[0:1] == '#' and key[-6:] == '_count')
+		for row, escape in self.rows:
+			value = row.get(key, SIFTER_UNDEFINED)
+			if value is not SIFTER_UNDEFINED:
+				if callable(value):
+					value = self._resolve(row, key, value)
+				return (value, escape is True or (escape and key in escape))
+
+			if count:
+				value = row.get(key[1:-6])
+				if callable(value):
+					value = self._resolve(row, key[1:-6], value)
+				if (
+					type(value) is not types.StringType and type(value) is not types.DictType and
+					hasattr(value, '__len__') and hasattr(value, '__iter__') and len(value) > 0
+				):
+					return (len(value), False)
 
-		return True
+		return (SIFTER_UNDEFINED, False)
 
-	def _append_text(self, str):
+	def _resolve(self, row, key, value):
 		"""
-		Appends string to this object
+		Calls callable replacement once in the rendering
 		
-		@return	bool
-		@param	string	str  String
+		@return	mixed	Value returned by the replacement
+		@param	array	row    Array of replacement which holds the replacement
+		@param	string	key    Name of variable
+		@param	object	value  Callable replacement
 		"""
-		if str != '':
-			if not self.contents or type(self.contents[self.content_index]) is not types.StringType:
-				self.content_index += 1
-				self.contents.append('')
-			self.contents[self.content_index] += str
+		# The row is held with the value, so that its id is not reused by another row in the rendering
+		id_ = (id(row), key)
+		entry = self.resolved.get(id_)
+		if entry is None or entry[0] is not row:
+			entry = self.resolved[id_] = (row, value())
 
-	def _append_element(self, type, param, noparse=False, str=''):
+		return entry[1]
+
+	def _get_loop(self, key):
 		"""
-		Appends block to this object
+		Returns loop variable specified by key
 		
-		@return	bool
-		@param	string	type     Type of this object
-		@param	string	param    Paramenter string
-		@param	bool	noparse  If this parameter is True, skips parsing added element
-		@param	string	str      Additional string
+		@return	tuple	Pair of replacement and escape flag for its rows
+		@param	string	key  Name of variable
 		"""
-		self.content_index += 1
-		self.contents.append(
-			SifterElement(
-				self, type, param, 
-				param if type == 'EMBED' else self.embed_flag, 
-				1 if type == 'NOBREAK' else self.nobreak_flag
-			)
-		)
-
-		if self.contents[self.content_index]:
-			if not noparse:
-				if not self.contents[self.content_index]._parse():
-					return False
+		value, escape = self._find(key)
+		if value is SIFTER_UNDEFINED:
+			raise KeyError(key)
 
-			if str and str != '':
-				self.contents[self.content_index]._append_text(str)
-			return True
-
-		return False
+		return (value, escape)
 
-	def _append_template(self, template_file):
+	def _get_rows(self, key, keep=False):
 		"""
-		Appends block to this object
+		Returns rows of LOOP block specified by key
 		
-		@return	bool
-		@param	string	template_file  Path to template file
+		Lists and tuples are returned as they are. Other iterables are read row by row,
+		and only their first row is read here to find whether they are empty.
+		
+		@return	tuple	Pair of iterable of rows (None if there is no row) and escape flag for the rows
+		@param	string	key   Name of variable
+		@param	bool	keep  If this parameter is True, iterator is kept for next call with the same key
 		"""
-		if template_file[0] != '/': template_file = self.template._get_dir_path() + '/' + template_file
-		if self.template._is_recursive(template_file):
-			self.template._raise_error(inspect.getlineno(sys._getframe())+1, 0, "'" + template_file + "' is included recursively")
-			return False
+		value, escape = self._get_loop(key)
+		if type(value) is types.ListType or type(value) is types.TupleType:
+			return ((value if len(value) > 0 else None), escape)
+		if (
+			type(value) is types.StringType or type(value) is types.UnicodeType or type(value) is types.DictType or
+			not hasattr(value, '__iter__')
+		):
+			return (None, escape)
+
+		rows = self.peeked.pop(id(value), None)
+		if rows is None:
+			iterator = iter(value)
+			try:
+				first = iterator.next()
+			except StopIteration:
+				return (None, escape)
+			rows = itertools.chain((first,), iterator)
+
+		if keep:
+			self.peeked[id(value)] = rows
+
+		return (rows, escape)
+
+	def get(self, key, default=None):
+		"""
+		Returns replacement specified by key, or default value
+		
+		@return	mixed	Replacement
+		@param	string	key      Name of variable
+		@param	mixed	default  Value returned if replacement does not exist
+		"""
+		value, escape = self._find(key)
+		if value is SIFTER_UNDEFINED:
+			return default
 
-		self.content_index += 1
-		self.contents.append(SifterTemplate(self, template_file, self.embed_flag, self.nobreak_flag))
-		if self.contents[self.content_index]:
-			return self.contents[self.content_index]._parse()
+		if escape:
+			if type(value) is types.StringType:
+				escaped = self.escaped.get(value)
+				if escaped is None:
+					escaped = self.escaped[value] = Sifter._convert_html_entities(value)
+				return escaped
+			elif type(value) is types.ListType or type(value) is types.TupleType:
+				# Arrays such as values of multiple select elements are held with their converted copies
+				entry = self.escaped.get(id(value))
+				if entry is None or entry[0] is not value:
+					entry = self.escaped[id(value)] = (value, Sifter._convert_html_entities(value))
+				return entry[1]
 
-		return False
+		return value
 
-	def _display_content(self, replace):
+	def __getitem__(self, key):
 		"""
-		Displays content
+		Returns replacement specified by key
 		
-		@return	bool
-		@param	array	replace  Array of replacement
+		@return	mixed	Replacement
+		@param	string	key  Name of variable
 		"""
-		literal = (self.type == 'LITERAL')
-
-		for content in self.contents:
-			if type(content) is not types.StringType:
-				if not content._display(replace):
-					return False
-			else:
-				# Text
-				if not literal:
-					if self.nobreak_flag != 0:
-						content = re.sub(r'[\r\n]', '', content)
-					content = Sifter.format(content, replace)
-					if self.embed_flag != 0:
-						content = Sifter._embed_values(content, replace, (self.embed_flag&2 != 0))
-
-				if self.top.capture_result:
-					self.top._append_result(content)
-				else:
-					sys.stdout.write(content)
+		value = self.get(key, SIFTER_UNDEFINED)
+		if value is SIFTER_UNDEFINED:
+			raise KeyError(key)
 
-		return True
+		return value
 
-	def _display(self, replace):
+	def __contains__(self, key):
 		"""
-		Applys template and displays
+		Returns True if replacement specified by key exists
 		
 		@return	bool
-		@param	array	replace  Array of replacement
+		@param	string	key  Name of variable
 		"""
-		if self.type == 'LOOP':
-			# LOOP block
-			if type(replace[self.param]) is not types.ListType or len(replace[self.param]) <= 0:
-				self.parent.prev_eval_result = False
-				return True
-
-			self.parent.prev_eval_result = True
+		return self._find(key)[0] is not SIFTER_UNDEFINED
 
-			i = 0
-			for temp in replace[self.param]:
-				if type(temp) is not types.DictType: temp = {'#value': temp}
 
-				temp = temp.copy()
-				temp.update(replace)
-				temp['#' + self.param + '_index'] = i
+class SifterFormatter(object):
+	"""
+	Replace tag class
+	
+	@package	Sifter
+	"""
 
-				if not self._display_content(temp): return False
+	__slots__ = ('key', 'operator', 'operand', 'precision', 'linebreak', 'quote')
 
-				i += 1
-		elif self.type == 'FOR':
+	######## Constructor
+	def __init__(self, key, operation='', comma='', options=''):
+		"""
+		Creates new SifterFormatter object
+		
+		@return	object
+		@param	string	key        Name of variable
+		@param	string	operation  Arithmetic operation
+		@param	string	comma      If this parameter is set, numeric value will be converted to comma formatted value
+		@param	string	options    Options
+		"""
+
+		######## Members
+		##
+		# Name of variable
+		# 
+		# @var	string
+		##
+		self.key = key
+
+		##
+		# Function of arithmetic operator (+, -, *, / or %), or None
+		# 
+		# @var	function
+		##
+		self.operator = None
+
+		##
+		# Right operand of arithmetic operation
+		# 
+		# @var	mixed
+		##
+		self.operand = None
+
+		##
+		# Number of decimal places of comma formatted value, or None
+		# 
+		# @var	int
+		##
+		self.precision = None
+
+		##
+		# Flag of converting linebreaks to "<br />"
+		# 
+		# @var	bool
+		##
+		self.linebreak = False
+
+		##
+		# Flag of escaping quotes, backslashes and linebreaks
+		# 
+		# @var	bool
+		##
+		self.quote = False
+
+		if operation:
+			operation = operation.strip()
+			self.operator = SIFTER_OPERATORS[operation[0]]
+			self.operand = SifterFormatter._to_number(operation[1:].strip())
+
+		if comma:
+			self.precision = int(comma[1:]) if comma[1:].isdigit() else 0
+
+		if options:
+			self.linebreak = (options.find('b') >= 0)
+			self.quote = (options.find('q') >= 0)
+
+	######## Methods
+	def _format(self, replace):
+		"""
+		Returns formatted value
+		
+		@return	string	Formatted value
+		@param	array	replace  Array of replacement
+		"""
+		value = replace.get(self.key, SIFTER_UNDEFINED)
+		if value is SIFTER_UNDEFINED:
+			value = ''
+
+		if self.operator is not None:
+			value = self.operator(SifterFormatter._to_number(value), self.operand)
+
+		if self.precision is not None:
+			if type(value) is not types.IntType and type(value) is not types.LongType:
+				value = SifterFormatter._to_number(str(value))
+			value = '%.*f' % (self.precision, value)
+
+			# Insert thousands separators
+			integer, point, fraction = value.partition('.')
+			sign = ''
+			if integer[0:1] == '-':
+				sign = '-'
+				integer = integer[1:]
+			if len(integer) > 3:
+				head = len(integer) % 3 or 3
+				integer = integer[0:head] + ''.join([',' + integer[i:i+3] for i in range(head, len(integer), 3)])
+			value = sign + integer + point + fraction
+		else:
+			value = str(value)
+			if value.find('.') >= 0 and SIFTER_NUMBER_PATTERN.match(value):
+				# Remove fractional part which consists of zeros
+				integer, point, fraction = value.partition('.')
+				if fraction.strip('0') == '':
+					value = integer
+
+		if self.linebreak:
+			# Convert linebreaks to "<br />"
+			value = re.sub(r'(\r?\n)', r'<br />\1', value)
+		if self.quote:
+			# Escape quotes, backslashes and linebreaks
+			value = re.sub(r'([\"\'\\]|&quot;)', lambda matches: '\\' + matches.group(1), value)
+			value = value.replace('\r', '\\r').replace('\n', '\\n')
+
+		return value
+
+	######## Static methods
+	@staticmethod
+	def _to_number(value):
+		"""
+		Converts leading decimal number of value into number
+		
+		@return	mixed	Integer or float, or 0 if value does not begin with decimal number
+		@param	mixed	value  Value
+		"""
+		if type(value) is types.IntType or type(value) is types.LongType:
+			return value
+
+		matches = SIFTER_DECIMAL_PATTERN.match(str(value))
+		if not matches:
+			return 0
+		elif matches.group(0).find('.') >= 0:
+			return float(matches.group(0))
+		else:
+			return int(matches.group(0))
+
+
+class SifterText(object):
+	"""
+	Template text class
+	
+	@package	Sifter
+	"""
+
+	__slots__ = ('text', 'line', 'segments', 'value', 'embed_flag', 'fields')
+
+	######## Constructor
+	def __init__(self, text='', literal=False, nobreak_flag=0, syntax=None, embed_flag=0, line=0):
+		"""
+		Creates new SifterText object
+		
+		@return	object
+		@param	string	text          Text
+		@param	bool	literal       If this parameter is True, replace tags are not parsed
+		@param	int		nobreak_flag  No-break flag
+		@param	object	syntax        Template syntax
+		@param	int		embed_flag    Embed flag
+		@param	int		line          Line number where text begins in template file
+		"""
+
+		######## Members
+		##
+		# Source text
+		# 
+		# @var	string
+		##
+		self.text = text
+
+		##
+		# Line number where text begins in template file
+		# 
+		# @var	int
+		##
+		self.line = line
+
+		##
+		# Literal strings and replace tags
+		# 
+		# @var	array
+		##
+		self.segments = []
+
+		##
+		# Text to output if this object has no replace tags
+		# 
+		# @var	string
+		##
+		self.value = None
+
+		##
+		# Embed flag
+		# 
+		# @var	int
+		##
+		self.embed_flag = 0
+
+		##
+		# Literal strings, replace tags and form elements, or None if values are embedded after formatting
+		# 
+		# @var	array
+		##
+		self.fields = None
+
+		if literal:
+			self.value = text
+			return None
+
+		self.embed_flag = embed_flag
+
+		if nobreak_flag != 0:
+			text = re.sub(r'[\r\n]', '', text)
+
+		self.segments = Sifter._tokenize(text, syntax)
+		if not self.segments:
+			self.value = ''
+		elif len(self.segments) == 1 and type(self.segments[0]) is types.StringType:
+			self.value = self.segments[0]
+
+		if embed_flag != 0:
+			self.fields = self._compile_fields(text, syntax or SIFTER_DEFAULT_SYNTAX, (embed_flag&2 != 0))
+			if self.fields is None or [field for field in self.fields if field.__class__ is SifterField]:
+				self.value = None
+
+	######## Methods
+	def _compile_fields(self, text, syntax, verbose):
+		"""
+		Splits text into literal strings, replace tags and form elements
+		
+		@return	array	Literal strings, SifterFormatter objects and SifterField objects, or None if some replace tag is placed in form element
+		@param	string	text     Text
+		@param	object	syntax   Template syntax
+		@param	bool	verbose  If this parameter is True, "checked" and "selected" attributes are output verbosely
+		"""
+		tags = [matches.span() for matches in syntax.replace_pattern.finditer(text)]
+
+		fields = []
+		position = 0
+		i = 0
+		for matches in SIFTER_EMBED_PATTERN.finditer(text):
+			while i < len(tags) and tags[i][1] <= matches.start():
+				i += 1
+			if i < len(tags) and tags[i][0] < matches.end():
+				return None
+
+			fields.extend(Sifter._tokenize(text[position:matches.start()], syntax))
+			fields.append(SifterField(matches.group(0), verbose))
+			position = matches.end()
+		fields.extend(Sifter._tokenize(text[position:], syntax))
+
+		return fields
+
+	def _format(self, replace):
+		"""
+		Replaces replace tags with values
+		
+		@return	string	Formatted string
+		@param	array	replace  Array of replacement
+		"""
+		if self.value is not None:
+			return self.value
+
+		result = []
+		if self.fields is not None:
+			for segment in self.fields:
+				if type(segment) is types.StringType:
+					result.append(segment)
+				elif segment.__class__ is SifterFormatter:
+					result.append(segment._format(replace))
+				else:
+					result.append(segment._embed(replace, replace.state))
+
+			return ''.join(result)
+
+		for segment in self.segments:
+			if type(segment) is not types.StringType:
+				result.append(segment._format(replace))
+			else:
+				result.append(segment)
+
+		if self.embed_flag != 0:
+			return Sifter._embed_values(''.join(result), replace, (self.embed_flag&2 != 0), replace.state)
+
+		return ''.join(result)
+
+
+class SifterField(object):
+	"""
+	Form element class for EMBED block
+	
+	@package	Sifter
+	"""
+
+	__slots__ = ('tag', 'element', 'name', 'value', 'parts', 'checked', 'unchecked')
+
+	######## Constructor
+	def __init__(self, tag, verbose=True):
+		"""
+		Creates new SifterField object
+		
+		@return	object
+		@param	string	tag      Tag of form element
+		@param	bool	verbose  If this parameter is True, "checked" and "selected" attributes are output verbosely
+		"""
+
+		######## Members
+		##
+		# Source tag
+		# 
+		# @var	string
+		##
+		self.tag = tag
+
+		##
+		# Name of element (input, textarea, select, /select or option)
+		# 
+		# @var	string
+		##
+		self.element = ''
+
+		##
+		# Id or name attribute
+		# 
+		# @var	string
+		##
+		self.name = None
+
+		##
+		# Value attribute of radio button, checkbox or option
+		# 
+		# @var	string
+		##
+		self.value = None
+
+		##
+		# Tag split at points where value is inserted
+		# 
+		# @var	array
+		##
+		self.parts = None
+
+		##
+		# Tag with "checked" or "selected" attribute
+		# 
+		# @var	string
+		##
+		self.checked = None
+
+		##
+		# Tag without "checked" or "selected" attribute
+		# 
+		# @var	string
+		##
+		self.unchecked = None
+
+		matches = re.search(r'^<(\/?.+?)\b', tag)
+		if matches:
+			self.element = matches.group(1).lower()
+
+		if self.element == 'input':
+			self.name = Sifter._get_element_id(tag)
+			type_ = (Sifter._get_attribute(tag, 'type') or '').lower()
+			if type_ == 'radio' or type_ == 'checkbox':
+				self.value = Sifter._get_attribute(tag, 'value')
+				self.checked = Sifter._set_attribute(tag, 'checked', 'checked', verbose)
+				self.unchecked = re.compile(r'(<input.*)\s+checked(?:=(\"|\'|\b)checked\2)?(\s*\/?>)', re.I|re.S).sub(
+					r'\1\3', tag, 1
+				)
+			else:
+				self.parts = Sifter._set_attribute(tag, 'value', "\0").split("\0")
+		elif self.element == 'textarea':
+			self.name = Sifter._get_element_id(tag)
+			matches = re.compile(r'(<textarea\b.*?>).*?(<\/textarea>)', re.I|re.S).search(tag)
+			if matches:
+				self.parts = [tag[0:matches.end(1)], tag[matches.start(2):]]
+		elif self.element == 'select':
+			self.name = re.sub(r'\[\]$', '', Sifter._get_element_id(tag) or '', 1)
+		elif self.element == 'option':
+			self.value = Sifter._get_attribute(tag, 'value')
+			if not self.value:
+				matches = re.compile(r'<option\b.*?>(.*?)(?:<\/option>|[\r\n])', re.I).search(tag)
+				if matches:
+					self.value = matches.group(1)
+			self.checked = Sifter._set_attribute(tag, 'selected', 'selected', verbose)
+			self.unchecked = re.compile(r'(<option.*)\s+selected(?:=(\"|\'|\b)selected\2)?(\s*\/?>)', re.I|re.S).sub(
+				r'\1\3', tag, 1
+			)
+
+	######## Methods
+	def _embed(self, values, state):
+		"""
+		Returns tag whose value is embedded
+		
+		@return	string	Value embedded tag
+		@param	array	values  Array of values to embed
+		@param	array	state   State of embedding, which holds name of current select element
+		"""
+		if self.element == 'input' or self.element == 'textarea':
+			if self.name is not None and self.name in values:
+				if self.checked is not None:
+					return self.checked if self.value == values[self.name] else self.unchecked
+				elif self.parts is not None:
+					value = values[self.name]
+					if not isinstance(value, types.StringTypes):
+						value = str(value)
+					return value.join(self.parts)
+		elif self.element == 'select':
+			if state.get('select_name', '') == '':
+				state['select_name'] = self.name
+		elif self.element == '/select':
+			state['select_name'] = ''
+		elif self.element == 'option':
+			select_name = state.get('select_name', '')
+			if select_name != '' and values[select_name]:
+				value = values[select_name]
+				if (type(value) is types.ListType and self.value in value) or self.value == value:
+					return self.checked
+				else:
+					return self.unchecked
+
+		return self.tag
+
+
+class SifterElement(object):
+	"""
+	Template element class
+	
+	@package	Sifter
+	"""
+
+	__slots__ = (
+		'top', 'template', 'parent', 'type', 'param', 'contents', 'content_index', 'embed_flag', 'nobreak_flag',
+		'condition', 'param_text', 'fragment', 'line', 'text_lines'
+	)
+
+	######## Constructor
+	def __init__(self, parent, type='', param='', embed_flag=0, nobreak_flag=0):
+		"""
+		Creates new SifterElement object
+		
+		@return	object
+		@param	object	parent        Parent object
+		@param	string	type          Type of this object
+		@param	string	param         Parameter string
+		@param	int		embed_flag    Embed flag
+		@param	int		nobreak_flag  No-break flag
+		"""
+
+		######## Members
+		##
+		# Holds top level object
+		# 
+		# @var	object
+		##
+		self.top = None
+
+		##
+		# Holds template object
+		# 
+		# @var	object
+		##
+		self.template = None
+
+		##
+		# Holds parent object
+		# 
+		# @var	object
+		##
+		self.parent = None
+
+		##
+		# Type of this object
+		# 
+		# @var	string
+		##
+		self.type = ''
+
+		##
+		# Parameter string
+		# 
+		# @var	string
+		##
+		self.param = ''
+
+		##
+		# Holds child objects
+		# 
+		# @var	array
+		##
+		self.contents = []
+
+		##
+		# Count child objects
+		# 
+		# @var	int
+		##
+		self.content_index = -1
+
+		##
+		# Embed flag
+		# 
+		# @var	int
+		##
+		self.embed_flag = 0
+
+		##
+		# No-break flag
+		# 
+		# @var	int
+		##
+		self.nobreak_flag = 0
+
+		##
+		# Function compiled from condition
+		# 
+		# @var	function
+		##
+		self.condition = None
+
+		##
+		# Parameter string split into literal strings and replace tags
+		# 
+		# @var	object
+		##
+		self.param_text = None
+
+		##
+		# Identity of CACHE block (file, line, parameter, flags and tag syntax), names of variables for key and time to live in seconds
+		# 
+		# @var	tuple
+		##
+		self.fragment = None
+
+		##
+		# Line number of control tag in template file
+		# 
+		# @var	int
+		##
+		self.line = 0
+
+		##
+		# Line numbers where texts begin, keyed by index of child objects (only while parsing)
+		# 
+		# @var	array
+		##
+		self.text_lines = {}
+
+		if not parent: return None
+
+		if parent._get_top():
+			self.top = parent._get_top()
+		else:
+			self.top = parent
+
+		if parent._get_template():
+			self.template = parent._get_template()
+		else:
+			self.template = parent
+
+		self.parent = parent
+		self.type = type
+		self.param = param
+		self.line = self.template._get_reading_line()
+		self.embed_flag   = embed_flag
+		self.nobreak_flag = nobreak_flag
+
+		if (type == 'IF' or type == 'ELSE') and param != '':
+			self.condition = Sifter._compile_condition(param)
+		elif type == 'FOR':
+			self.param_text = SifterText(param, False, 0, self.template.syntax)
+		elif type == 'CACHE':
+			names, ttl = Sifter._parse_fragment_param(param)
+			self.fragment = (
+				(os.path.realpath(self.template.template_file), self.line, param, embed_flag, nobreak_flag, self.template.syntax.key),
+				names, ttl
+			)
+
+	######## Methods
+	def _get_top(self):
+		"""
+		Returns reference to top level object
+		
+		@return	object	Reference to top level object
+		"""
+		return self.top
+
+	def _get_template(self):
+		"""
+		Returns reference to template object
+		
+		@return	object	Reference to template object
+		"""
+		return self.template
+
+	def _get_parent(self):
+		"""
+		Returns reference to parent object
+		
+		@return	object	Reference to parent object
+		"""
+		return self.parent
+
+	def _parse(self):
+		"""
+		Reads and parses template file
+		
+		@return	bool
+		"""
+		literal = (self.type == 'LITERAL')
+
+		template = self.template
+		regexp = template.syntax.control_pattern
+		while template.position < template.line_end or template._read_line():
+			matches = regexp.search(template.source, template.position, template.line_end)
+			if not matches:
+				# Text
+				self._append_text(template.source[template.position:template.line_end])
+				template.position = template.line_end
+				continue
+
+			end = matches.end()
+			matches = (None, template.source[template.position:matches.start()], matches.group(0)) + matches.groups()
+
+			if literal and matches[3] != 'END_LITERAL':
+				# LITERAL block
+				self._append_text(matches[1] + matches[2])
+				template.position = end
+				template._set_preserve_spaces_flag(True)
+				continue
+
+			if end < template.line_text_end or re.search(r'[^\s]', matches[1]):
+				self._append_text(matches[1])
+				template.position = end
+				template._set_preserve_spaces_flag(True)
+			elif template._get_preserve_spaces_flag() or matches[3] == 'END_NOBREAK':
+				self._append_text(re.sub(r'[^\r\n]', '', matches[1]))
+				template.position = template.line_end - len(re.sub(r'[^\r\n]', '', template.source[end:template.line_end]))
+			else:
+				template.position = template.line_end
+
+			type_ = matches[5] if matches[5] else ''
+			param = re.sub(r'^\s+|\s+$', '', matches[6]) if matches[6] else ''
+
+			if matches[4]:
+				# End of block
+				if param == '' and (self.type == type_ or (self.type == 'ELSE' and (type_ == 'IF' or type_ == 'LOOP'))):
+					return True
+				else:
+					self.template._raise_error(inspect.getlineno(sys._getframe())+1)
+					return False
+
+			if (type_ == 'LOOP' or type_ == 'FOR') and param != '':
+				# LOOP, FOR block
+				if not self._append_element(type_, param):
+					return False
+			elif type_ == 'IF' and param != '':
+				# IF block
+				param = Sifter._check_condition(param, template.syntax)
+				if not param:
+					return False
+				if not self._append_element(type_, param):
+					return False
+			elif type_ == 'ELSE':
+				# ELSE block
+				if self.type == 'LOOP' and param == '':
+					if not self.parent._append_element(type_, param):
+						return False
+					break
+				elif self.type == 'IF' or self.type == 'ELSE':
+					param = Sifter._check_condition(param, template.syntax)
+					if param != '' and not param:
+						self.template._raise_error(inspect.getlineno(sys._getframe())+1)
+						return False
+					if not self.parent._append_element(type_, param):
+						return False
+					break
+				else:
+					self.template._raise_error(inspect.getlineno(sys._getframe())+1)
+					return False
+			elif type_ == '?' and param != '':
+				# ?
+				condition = False
+				matches = re.compile(SIFTER_CONDITIONAL_EXPRESSION).search(param)
+				if matches:
+					matches = (None,) + matches.groups()
+					condition = Sifter._check_condition(matches[1], template.syntax)
+				if not condition:
+					self.template._raise_error(inspect.getlineno(sys._getframe())+1)
+					return False
+				if not self._append_element('IF', condition, True, re.sub(r'\\(.)', r'\1', matches[2])):
+					return False
+				if not self._append_element('ELSE', '', True, re.sub(r'\\(.)', r'\1', matches[3])):
+					return False
+			elif type_ == 'EMBED':
+				# EMBED block
+				param = param.lower()
+				if param == '' or param == 'xml' or param == 'html':
+					if not self._append_element(type_, 1 if param == 'html' else 3):
+						return False
+				else:
+					self.template._raise_error(inspect.getlineno(sys._getframe())+1)
+					return False
+			elif (type_ == 'NOBREAK' or type_ == 'LITERAL') and param == '':
+				# NOBREAK, LITERAL block
+				if not self._append_element(type_, ''):
+					return False
+			elif type_ == 'BLOCK' and re.search(r'^\w+$', param):
+				# BLOCK block
+				if not self._append_element(type_, param):
+					return False
+			elif type_ == 'CACHE' and Sifter._parse_fragment_param(param):
+				# CACHE block
+				if not self._append_element(type_, param):
+					return False
+			elif type_ == 'INCLUDE' and param != '':
+				# INCLUDE
+				if not self._append_template(param):
+					return False
+			else:
+				# Syntax error
+				self.template._raise_error(inspect.getlineno(sys._getframe())+1)
+				return False
+
+		return True
+
+	def _append_text(self, str):
+		"""
+		Appends string to this object
+		
+		@return	bool
+		@param	string	str  String
+		"""
+		if str != '':
+			if not self.contents or type(self.contents[self.content_index]) is not types.StringType:
+				self.content_index += 1
+				self.contents.append('')
+				self.text_lines[self.content_index] = self.template._get_reading_line()
+			self.contents[self.content_index] += str
+
+	def _append_element(self, type, param, noparse=False, str=''):
+		"""
+		Appends block to this object
+		
+		@return	bool
+		@param	string	type     Type of this object
+		@param	string	param    Paramenter string
+		@param	bool	noparse  If this parameter is True, skips parsing added element
+		@param	string	str      Additional string
+		"""
+		element = SifterElement(
+			self, type, param, 
+			param if type == 'EMBED' else self.embed_flag, 
+			1 if type == 'NOBREAK' else self.nobreak_flag
+		)
+		self.content_index += 1
+		self.contents.append(element)
+
+		if element:
+			if not noparse:
+				if not element._parse():
+					return False
+
+			if str and str != '':
+				element._append_text(str)
+			element._tokenize_text()
+			return True
+
+		return False
+
+	def _tokenize_text(self):
+		"""
+		Splits text of this object into literal strings and replace tags
+		
+		"""
+		for i in range(0, len(self.contents)):
+			if type(self.contents[i]) is types.StringType:
+				self.contents[i] = SifterText(
+					self.contents[i], self.type == 'LITERAL', self.nobreak_flag, self.template.syntax, self.embed_flag,
+					self.text_lines.get(i, 0)
+				)
+		self.text_lines = None
+
+	def _append_template(self, template_file):
+		"""
+		Appends block to this object
+		
+		@return	bool
+		@param	string	template_file  Path to template file
+		"""
+		if template_file[0] != '/': template_file = self.template._get_dir_path() + '/' + template_file
+		if self.template._is_recursive(template_file):
+			self.template._raise_error(inspect.getlineno(sys._getframe())+1, 0, "'" + template_file + "' is included recursively")
+			return False
+
+		cache = self.template.top.cache
+		if cache:
+			key = (os.path.realpath(template_file), self.template.syntax.key, self.embed_flag, self.nobreak_flag)
+			template = cache.get(key)
+			if template:
+				files = []
+				template._get_files(files)
+				for file_ in files:
+					if self.template._is_recursive(file_):
+						self.template._raise_error(inspect.getlineno(sys._getframe())+1, 0, "'" + file_ + "' is included recursively")
+						return False
+
+				self.content_index += 1
+				self.contents.append(template)
+				return True
+
+		template = SifterTemplate(self, template_file, self.embed_flag, self.nobreak_flag)
+		self.content_index += 1
+		self.contents.append(template)
+		if not template._parse():
+			return False
+
+		if cache:
+			template._release()
+			cache.set(key, template)
+
+		return True
+
+	def _display_content(self, replace):
+		"""
+		Displays content
+		
+		@return	generator	Output strings
+		@param	array	replace  Array of replacement
+		"""
+		profiler = replace.state.get('profiler')
+		prev_eval_result = True
+
+		for content in self.contents:
+			if content.__class__ is SifterText:
+				# Text
+				if profiler is None:
+					yield content._format(replace)
+				else:
+					start = profiler._begin()
+					result = content._format(replace)
+					profiler._end(self, content, start, len(result), 1)
+					yield result
+				continue
+
+			count = 1
+			if content.__class__ is SifterElement and (content.type == 'IF' or content.type == 'ELSE' or content.type == 'LOOP'):
+				if content.type == 'ELSE' and prev_eval_result:
+					continue
+				if profiler is None:
+					prev_eval_result = content._evaluate(replace)
+				else:
+					start = profiler._begin()
+					prev_eval_result = content._evaluate(replace)
+					profiler._end(self, content, start, 0, 1)
+					count = 0
+				if not prev_eval_result:
+					continue
+
+			if profiler is None:
+				for result in content._display(replace):
+					yield result
+			else:
+				for result in profiler._iterate(self, content, content._display(replace), count):
+					yield result
+
+	def _evaluate(self, replace):
+		"""
+		Returns True if content of IF, ELSE or LOOP block is to be displayed
+		
+		@return	bool
+		@param	array	replace  Array of replacement
+		"""
+		if self.type == 'LOOP':
+			return replace._get_rows(self.param, True)[0] is not None
+		elif self.condition:
+			return bool(self.condition(replace))
+		else:
+			return bool(self.param == '' or eval(self.param))
+
+	def _display(self, replace):
+		"""
+		Applys template and displays
+		
+		Conditions of IF and ELSE blocks are evaluated by parent object.
+		
+		@return	generator	Output strings
+		@param	array	replace  Array of replacement
+		"""
+		if self.type == 'LOOP':
+			# LOOP block
+			values, escape = replace._get_rows(self.param)
+			if values is None:
+				return
+
+			name = '#' + self.param + '_index'
+			i = 0
+			for temp in values:
+				if type(temp) is not types.DictType: temp = {'#value': temp}
+
+				for result in self._display_content(SifterScope(replace, temp, name, i, escape)):
+					yield result
+
+				i += 1
+		elif self.type == 'FOR':
+			# FOR block
+			for i in Sifter._get_for_range(self.param_text._format(replace)):
+				for result in self._display_content(SifterScope(replace, None, '#value', i)):
+					yield result
+		elif self.type == 'CACHE':
+			# CACHE block
+			yield self._get_fragment(replace, self._display_content)
+		else:
+			# Other types of block
+			for result in self._display_content(replace):
+				yield result
+
+	def _get_fragment(self, replace, render):
+		"""
+		Returns output of CACHE block from fragment cache, or renders and stores it
+		
+		@return	string	Output string
+		@param	array		replace  Array of replacement
+		@param	function	render   Function which returns iterator of output strings of contents
+		"""
+		identity, names, ttl = self.fragment
+		cache = replace.state.get('fragment_cache')
+		if cache is None or ttl == 0:
+			return ''.join(render(replace))
+
+		key = (identity, tuple([repr(replace.get(name)) for name in names]))
+		result = cache.get(key)
+		if result is None:
+			result = ''.join(render(replace))
+			cache.set(key, result, ttl)
+
+		return result
+
+	def _release(self):
+		"""
+		Releases reference to top level object after parsing
+		
+		"""
+		self.top = None
+		self.parent = None
+		self.text_lines = None
+		for content in self.contents:
+			if content.__class__ is not SifterText:
+				content._release()
+
+	def __getstate__(self):
+		"""
+		Returns state to be pickled, without compiled condition
+		
+		@return	array	Members
+		"""
+		state = dict([(name, getattr(self, name)) for name in self.__slots__])
+		state['condition'] = None
+		return state
+
+	def __setstate__(self, state):
+		"""
+		Restores unpickled state and compiles condition
+		
+		@param	array	state  Members
+		"""
+		for name in state.keys():
+			setattr(self, name, state[name])
+		if (self.type == 'IF' or self.type == 'ELSE') and self.param != '':
+			self.condition = Sifter._compile_condition(self.param)
+
+	def _find_blocks(self, blocks):
+		"""
+		Collects BLOCK elements in this object and included templates
+		
+		@param	array	blocks  Array to store pairs of BLOCK element and None, keyed by name of block
+		"""
+		for content in self.contents:
+			if content.__class__ is SifterElement:
+				if content.type == 'BLOCK' and content.param not in blocks:
+					blocks[content.param] = [content, None]
+				content._find_blocks(blocks)
+			elif content.__class__ is SifterTemplate:
+				content.contents._find_blocks(blocks)
+
+	def _get_files(self, files):
+		"""
+		Collects paths to template files included by this object
+		
+		@param	array	files  Array to append paths
+		"""
+		for content in self.contents:
+			if content.__class__ is not SifterText:
+				content._get_files(files)
+
+	def _display_tree(self, max_length=20, tabs=''):
+		"""
+		Displays template structure as a tree
+		
+		@param	int		max_length  Number of characters to display text
+		@param	string	tabs        Tab characters
+		"""
+		if self.type != '':
+			sys.stdout.write(tabs + "[" + self.type)
+			if self.param != '': sys.stdout.write('(' + str(self.param) + ')')
+			sys.stdout.write("]\n")
+		else:
+			sys.stdout.write(tabs + "[TEMPLATE:" + self.template.template_file + "]\n")
+
+		for content in self.contents:
+			if content.__class__ is SifterElement:
+				content._display_tree(max_length, tabs + "\t")
+			elif content.__class__ is SifterTemplate:
+				content._display_tree(max_length, tabs + "\t")
+			else:
+				content = re.sub(r'[\r\n]', ' ', content.text)
+				sys.stdout.write(tabs + "\t[TEXT:" + content[0:max_length] + "]\n")
+
+
+class SifterTemplate(object):
+	"""
+	Template control class
+	
+	@package	Sifter
+	"""
+
+	__slots__ = (
+		'top', 'template', 'parent', 'contents', 'template_file', 'dir_path', 'fp', 'source', 'position', 'line_end',
+		'line_text_end', 'reading_line', 'preserve_spaces', 'embed_flag', 'nobreak_flag', 'function', 'blocks', 'syntax'
+	)
+
+	######## Constructor
+	def __init__(self, parent, template_file='', embed_flag=0, nobreak_flag=0):
+		"""
+		Creates new SifterTemplate object
+		
+		@return	object
+		@param	object	parent         Parent object
+		@param	string	template_file  Path to template file
+		@param	int		embed_flag     Embed flag
+		@param	int		nobreak_flag   No-break flag
+		"""
+
+		######## Members
+		##
+		# Holds top level object
+		# 
+		# @var	object
+		##
+		self.top = None
+
+		##
+		# Holds template object
+		# 
+		# @var	object
+		##
+		self.template = None
+
+		##
+		# Holds parent object
+		# 
+		# @var	object
+		##
+		self.parent = None
+
+		##
+		# Holds child objects
+		# 
+		# @var	object
+		##
+		self.contents = None
+
+		##
+		# Path to template file
+		# 
+		# @var	string
+		##
+		self.template_file = ''
+
+		##
+		# Path to directory includes template file
+		# 
+		# @var	string
+		##
+		self.dir_path = ''
+
+		##
+		# File pointer of template file
+		# 
+		# @var	resource
+		##
+		self.fp = None
+
+		##
+		# Source of template file
+		# 
+		# @var	string
+		##
+		self.source = ''
+
+		##
+		# Offset of text not parsed yet
+		# 
+		# @var	int
+		##
+		self.position = 0
+
+		##
+		# Offset of end of currently reading line
+		# 
+		# @var	int
+		##
+		self.line_end = 0
+
+		##
+		# Offset of end of last non-space character in currently reading line
+		# 
+		# @var	int
+		##
+		self.line_text_end = 0
+
+		##
+		# Line number in currently reading file
+		# 
+		# @var	int
+		##
+		self.reading_line = 0
+
+		##
+		# Flag of preserving spaces in the line that includes control tags only
+		# 
+		# @var	bool
+		##
+		self.preserve_spaces = False
+
+		##
+		# Embed flag
+		# 
+		# @var	int
+		##
+		self.embed_flag = 0
+
+		##
+		# No-break flag
+		# 
+		# @var	int
+		##
+		self.nobreak_flag = 0
+
+		##
+		# Render function compiled from this template
+		# 
+		# @var	function
+		##
+		self.function = None
+
+		##
+		# Pairs of BLOCK element and its render function, keyed by name of block
+		# 
+		# @var	array
+		##
+		self.blocks = None
+
+		##
+		# Template syntax
+		# 
+		# @var	object
+		##
+		self.syntax = None
+
+		if not parent: return None
+
+		if parent.__class__ is Sifter or not parent._get_top():
+			self.top = parent
+			self.parent = None
+		else:
+			self.top = parent._get_top()
+			self.parent = parent
+
+		self.syntax = self.top.syntax
+		self._set_template_file(template_file)
+
+		self.embed_flag   = embed_flag
+		self.nobreak_flag = nobreak_flag
+
+	######## Methods
+	def _get_top(self):
+		"""
+		Returns reference to top level object
+		
+		@return	object	Reference to top level object
+		"""
+		return self.top
+
+	def _get_template(self):
+		"""
+		Returns reference to template object
+		
+		@return	object	Reference to template object
+		"""
+		return self.template
+
+	def _get_parent(self):
+		"""
+		Returns reference to parent object
+		
+		@return	object	Reference to parent object
+		"""
+		return self.parent
+
+	def _set_template_file(self, template_file):
+		"""
+		Specifies path to template file
+		
+		@param	string	template_file  Path to template file
+		"""
+		self.template_file = template_file
+		self._set_dir_path(template_file)
+
+	def _get_template_file(self):
+		"""
+		Returns path to template file
+		
+		@return	string	Path to template file
+		"""
+		return self.template_file
+
+	def _set_dir_path(self, template_file):
+		"""
+		Specifies path to directory includes template file
+		
+		@param	string	template_file  Path to template file
+		"""
+		matches = re.search(r'^(.*)\/', template_file)
+		if matches:
+			self.dir_path = matches.group(1)
+		else:
+			self.dir_path = '.'
+
+	def _get_dir_path(self):
+		"""
+		Returns path to directory includes template file
+		
+		@return	string	Path to directory includes template file
+		"""
+		return self.dir_path
+
+	def _set_preserve_spaces_flag(self, flag):
+		"""
+		Preserves spaces in the line that includes control tags only
+		
+		@param	bool	flag  If this parameter is true, spaces in the line that includes control tags only will be preserved
+	"""
+		self.preserve_spaces = flag
+
+	def _get_preserve_spaces_flag(self):
+		"""
+		Returns true if spaces in the line that includes control tags only will be preserved
+		
+		@return	bool
+		"""
+		return self.preserve_spaces
+
+	def _is_recursive(self, template_file):
+		"""
+		Returns True if specified template is included recursively
+		
+		@return	bool
+		@param	string	template_file  Path to template file
+		"""
+		if self.template_file == template_file:
+			return True
+		elif self.parent:
+			return self.parent.template._is_recursive(template_file)
+		else:
+			return False
+
+	def _increment_file_line(self):
+		"""
+		Counts up line number in currently reading file
+		
+		"""
+		self.reading_line += 1
+
+	def _get_reading_line(self):
+		"""
+		Returns line number in currently reading file
+		
+		@return	int	Line number in currently reading file
+		"""
+		return self.reading_line
+
+	def _read_line(self):
+		"""
+		Moves to next line of template file
+		
+		@return	bool
+		"""
+		if self.line_end < len(self.source):
+			self.position = self.line_end
+			self.line_end = self.source.find("\n", self.position) + 1
+			if self.line_end <= 0:
+				self.line_end = len(self.source)
+			self.line_text_end = self.position + len(self.source[self.position:self.line_end].rstrip())
+
+			self._increment_file_line()
+			self._set_preserve_spaces_flag(False)
+			return True
+
+		return False
+
+	def _parse(self):
+		"""
+		Reads and parses template file
+		
+		@return	bool
+		"""
+		if not self.contents:
+			self.contents = SifterElement(self, '', '', self.embed_flag, self.nobreak_flag)
+
+		self.fp = open(self.template_file, 'rU')
+		if not self.fp:
+			self._write_error(SIFTER_PACKAGE + ": Cannot open file '" + self.template_file + "'.")
+			return False
+
+		self.source = self.fp.read()
+		self.fp.close()
+		self.position = self.line_end = 0
+
+		if not self.contents._parse():
+			if not self.parent:
+				self._write_error(SIFTER_PACKAGE + ": Error(s) occurred while parsing file '" + self.template_file + "'.")
+				self._write_error(SIFTER_PACKAGE + ": " + str(self._get_reading_line()) + " lines have been read.")
+
+			return False
+
+		self.contents._tokenize_text()
+		return True
+
+	def _release(self):
+		"""
+		Releases reference to top level object after parsing
+		
+		"""
+		self.top = None
+		self.parent = None
+		self.fp = None
+		self.source = ''
+		if self.contents:
+			self.contents._release()
+
+	def __getstate__(self):
+		"""
+		Returns state to be pickled, without references to outer templates and compiled function
+		
+		@return	array	Members
+		"""
+		state = dict([(name, getattr(self, name)) for name in self.__slots__])
+		state['top'] = None
+		state['parent'] = None
+		state['fp'] = None
+		state['function'] = None
+		state['blocks'] = None
+		return state
+
+	def __setstate__(self, state):
+		"""
+		Restores unpickled state
+		
+		@param	array	state  Members
+		"""
+		for name in state.keys():
+			setattr(self, name, state[name])
+
+	def _get_files(self, files):
+		"""
+		Collects paths to this template file and included files
+		
+		@param	array	files  Array to append paths
+		"""
+		files.append(self.template_file)
+		if self.contents:
+			self.contents._get_files(files)
+
+	def _compile(self):
+		"""
+		Returns render function compiled from this template
+		
+		@return	function	Render function
+		"""
+		if not self.function:
+			self.function = SifterCompiler().compile(self)
+
+		return self.function
+
+	def _get_block(self, name):
+		"""
+		Returns BLOCK element specified by name
+		
+		@return	object	BLOCK element, or None
+		@param	string	name  Name of block
+		"""
+		if self.blocks is None:
+			blocks = {}
+			self.contents._find_blocks(blocks)
+			self.blocks = blocks
+
+		entry = self.blocks.get(name)
+		return entry[0] if entry else None
+
+	def _compile_block(self, name):
+		"""
+		Returns render function compiled from BLOCK element
+		
+		@return	function	Render function
+		@param	string	name  Name of block
+		"""
+		element = self._get_block(name)
+		entry = self.blocks[name]
+		if not entry[1]:
+			entry[1] = SifterCompiler().compile(self, element)
+
+		return entry[1]
+
+	def _display(self, replace):
+		"""
+		Applys template and displays
+		
+		@return	generator	Output strings
+		@param	array	replace  Array of replacement
+		"""
+		return self.contents._display(replace)
+
+	def _display_tree(self, max_length=20, tabs=''):
+		"""
+		Displays template structure as a tree
+		
+		@return	bool
+		@param	int		max_length  Number of characters to display text
+		@param	string	tabs        Tab characters
+		"""
+		return self.contents._display_tree(max_length, tabs)
+
+	def _raise_error(self, script_line=0, line=0, error=''):
+		"""
+		Displays syntax error
+		
+		@param	int		script_line  Line number in this script
+		@param	int		line         Line number in currently reading file
+		@param	string	error        Error string
+		"""
+		file_ = self._get_template_file()
+		line = line if line else self._get_reading_line()
+		error = error if error else 'Syntax error'
+		message = SIFTER_PACKAGE
+		if SIFTER_DEBUG:
+			if script_line != 0:
+				message += "(%(script_line)s)" % locals()
+		message += ": %(error)s in %(file_)s on line %(line)s." % locals()
+		self._write_error(message)
+
+	def _write_error(self, message):
+		"""
+		Displays error message, or collects it if top level object collects errors
+		
+		@param	string	message  Error message
+		"""
+		top = self._get_top()
+		if top and top.errors is not None:
+			top.errors.append(message)
+		else:
+			sys.stdout.write(message + "\n")
+
+
+class SifterProfiler:
+	"""
+	Render profiler class
+	
+	@package	Sifter
+	"""
+
+	######## Constructor
+	def __init__(self):
+		"""
+		Creates new SifterProfiler object
+		
+		@return	object
+		"""
+
+		######## Members
+		##
+		# Counts, total times, self times and output bytes, keyed by tuples of file, line and block
+		# 
+		# @var	array
+		##
+		self.stats = {}
+
+		##
+		# Times spent in child blocks of blocks being measured
+		# 
+		# @var	array
+		##
+		self.stack = []
+
+	######## Methods
+	def _get_key(self, parent, content):
+		"""
+		Returns key to identify block by its origin
+		
+		@return	tuple	File, line and name of block
+		@param	object	parent   Parent element
+		@param	object	content  Child object
+		"""
+		if content.__class__ is SifterText:
+			return (parent.template.template_file, content.line, 'TEXT')
+		elif content.__class__ is SifterTemplate:
+			return (content.template_file, 0, 'INCLUDE')
+		elif content.param != '' and content.type != 'EMBED':
+			return (parent.template.template_file, content.line, content.type + '(' + str(content.param) + ')')
+		else:
+			return (parent.template.template_file, content.line, content.type)
+
+	def _begin(self):
+		"""
+		Starts measuring time
+		
+		@return	float	Start time
+		"""
+		self.stack.append(0.0)
+		return timeit.default_timer()
+
+	def _end(self, parent, content, start, length, count):
+		"""
+		Records time spent since _begin() was called
+		
+		@param	object	parent   Parent element
+		@param	object	content  Measured object
+		@param	float	start    Start time
+		@param	int		length   Number of output bytes
+		@param	int		count    Number of calls to add
+		"""
+		elapsed = timeit.default_timer() - start
+		children = self.stack.pop()
+		if self.stack:
+			self.stack[-1] += elapsed
+
+		key = self._get_key(parent, content)
+		stat = self.stats.get(key)
+		if stat is None:
+			stat = self.stats[key] = [0, 0.0, 0.0, 0]
+		stat[0] += count
+		stat[1] += elapsed
+		stat[2] += elapsed - children
+		stat[3] += length
+
+	def _iterate(self, parent, content, iterator, count):
+		"""
+		Measures time to get each output string from iterator
+		
+		@return	generator	Output strings
+		@param	object	parent    Parent element
+		@param	object	content   Measured object
+		@param	object	iterator  Iterator of output strings
+		@param	int		count     Number of calls to add
+		"""
+		while True:
+			start = self._begin()
+			try:
+				result = iterator.next()
+			except StopIteration:
+				self._end(parent, content, start, 0, count)
+				return
+			self._end(parent, content, start, len(result), count)
+			count = 0
+			yield result
+
+	def _display(self, limit=None):
+		"""
+		Displays profile
+		
+		@param	int		limit  Maximum number of blocks to display
+		"""
+		keys = sorted(self.stats.keys(), key=lambda key: -self.stats[key][1])
+		if limit is not None:
+			keys = keys[0:limit]
+
+		sys.stdout.write("%10s %10s %8s %10s  %s\n" % ('total(ms)', 'self(ms)', 'calls', 'bytes', 'file:line block'))
+		for key in keys:
+			stat = self.stats[key]
+			sys.stdout.write("%10.3f %10.3f %8d %10d  %s:%d %s\n" % (
+				stat[1] * 1000, stat[2] * 1000, stat[0], stat[3], key[0], key[1], key[2]
+			))
+
+
+class SifterCompiler:
+	"""
+	Template compiler class
+	
+	@package	Sifter
+	"""
+
+	######## Constructor
+	def __init__(self):
+		"""
+		Creates new SifterCompiler object
+		
+		@return	object
+		"""
+
+		######## Members
+		##
+		# Lines of generated source code
+		# 
+		# @var	array
+		##
+		self.lines = []
+
+		##
+		# Count generated local variables
+		# 
+		# @var	int
+		##
+		self.var_index = 0
+
+		##
+		# Objects referred from generated source code
+		# 
+		# @var	array
+		##
+		self.constants = {}
+
+	######## Methods
+	def _new_var(self, prefix):
+		"""
+		Returns unique name of local variable
+		
+		@return	string	Name of local variable
+		@param	string	prefix  Prefix of name
+		"""
+		self.var_index += 1
+		return prefix + str(self.var_index)
+
+	def _write(self, indent, line):
+		"""
+		Appends line of source code
+		
+		@param	int		indent  Indent level
+		@param	string	line    Source code
+		"""
+		self.lines.append("\t" * indent + line)
+
+	def _compile_segments(self, text, prefix=''):
+		"""
+		Generates expression that formats text
+		
+		@return	string	Expression
+		@param	object	text    Text object
+		@param	string	prefix  Constant string output before text
+		"""
+		if text.value is not None:
+			return repr(prefix + text.value)
+
+		parts = []
+		constant = prefix
+		for segment in text.segments:
+			if type(segment) is types.StringType:
+				constant += segment
+			else:
+				if constant != '':
+					parts.append(repr(constant))
+					constant = ''
+				name = self._new_var('f')
+				self.constants[name] = segment
+				parts.append(name + '._format(replace)')
+		if constant != '':
+			parts.append(repr(constant))
+
+		return ' + '.join(parts)
+
+	def _get_constant(self, content):
+		"""
+		Returns output of text or block which refers no variables
+		
+		@return	string	Output string, or None if output depends on replacements
+		@param	object	content  Text, element or template object
+		"""
+		if content.__class__ is SifterText:
+			return content.value
+		elif content.__class__ is SifterTemplate:
+			content = content.contents
+		elif content.type != 'NOBREAK' and content.type != 'LITERAL' and content.type != 'EMBED' and content.type != 'BLOCK':
+			return None
+
+		result = []
+		for child in content.contents:
+			value = self._get_constant(child)
+			if value is None:
+				return None
+			result.append(value)
+
+		return ''.join(result)
+
+	def _compile_text(self, element, text, indent, prefix=''):
+		"""
+		Generates code to yield text
+		
+		@param	object	element  Element that holds text
+		@param	object	text     Text object
+		@param	int		indent   Indent level
+		@param	string	prefix   Constant string output before text
+		"""
+		if text.embed_flag != 0 and text.value is None:
+			name = self._new_var('t')
+			self.constants[name] = text
+			expression = name + '._format(replace)'
+			if prefix != '':
+				expression = repr(prefix) + ' + ' + expression
+		else:
+			expression = self._compile_segments(text, prefix)
+
+		self._write(indent, 'yield ' + expression)
+
+	def _compile_content(self, element, indent):
+		"""
+		Generates code to yield content
+		
+		Texts and blocks which refer no variables are rendered here, and adjoining ones are yielded as one string.
+		
+		@param	object	element  Element
+		@param	int		indent   Indent level
+		"""
+		flag = self._new_var('c')
+		for content in element.contents:
+			if content.__class__ is SifterElement and self._get_constant(content) is None:
+				self._write(indent, flag + ' = True')
+				break
+
+		constant = []
+		for content in element.contents:
+			value = self._get_constant(content)
+			if value is not None:
+				constant.append(value)
+				continue
+
+			if content.__class__ is SifterText:
+				self._compile_text(element, content, indent, ''.join(constant))
+				constant = []
+				continue
+
+			if constant and ''.join(constant) != '':
+				self._write(indent, 'yield ' + repr(''.join(constant)))
+			constant = []
+
+			if content.__class__ is SifterElement:
+				self._compile_element(content, indent, flag)
+			else:
+				self._compile_content(content.contents, indent)
+
+		if constant and ''.join(constant) != '':
+			self._write(indent, 'yield ' + repr(''.join(constant)))
+
+	def _compile_element(self, element, indent, flag):
+		"""
+		Generates code to apply block
+		
+		@param	object	element  Element
+		@param	int		indent   Indent level
+		@param	string	flag     Name of variable that holds result of previous evaluation of condition
+		"""
+		if element.type == 'LOOP':
+			# LOOP block
+			outer = self._new_var('s')
+			values = self._new_var('v')
+			escape = self._new_var('e')
+			index = self._new_var('i')
+			self._write(indent, outer + ' = replace')
+			self._write(indent, values + ', ' + escape + ' = replace._get_rows(' + repr(element.param) + ')')
+			self._write(indent, 'if ' + values + ' is None:')
+			self._write(indent+1, flag + ' = False')
+			self._write(indent, 'else:')
+			self._write(indent+1, flag + ' = True')
+			self._write(indent+1, index + ' = 0')
+			self._write(indent+1, 'for replace in ' + values + ':')
+			self._write(indent+2, "if type(replace) is not types.DictType: replace = {'#value': replace}")
+			self._write(indent+2, 'replace = SifterScope(' + outer + ', replace, ' + repr('#' + element.param + '_index') + ', ' + index + ', ' + escape + ')')
+			self._compile_content(element, indent+2)
+			self._write(indent+2, index + ' += 1')
+			self._write(indent+1, 'replace = ' + outer)
+		elif element.type == 'CACHE':
+			# CACHE block
+			render = self._new_var('r')
+			name = self._new_var('e')
+			self.constants[name] = element
+			self._write(indent, 'def ' + render + '(replace):')
+			self._compile_content(element, indent+1)
+			self._write(indent+1, "yield ''")
+			self._write(indent, 'yield ' + name + '._get_fragment(replace, ' + render + ')')
+		elif element.type == 'FOR':
 			# FOR block
-			matches = re.search(r'^(-?\d+),\s*(-?\d+)(?:,\s*(-?\d+))?$', Sifter.format(self.param, replace))
-			if matches:
-				matches = (None,) + matches.groups()
-			if matches:
-				j = int(matches[1])
-				k = int(matches[2])
-				l = int(matches[3]) if matches[3] else (1 if j<=k else -1)
-				temp = replace.copy()
-				i = j
-				while (l>0 and i<=k) or (l<0 and i>=k):
-					temp['#value'] = i
-					if not self._display_content(temp): return False
-					i += l
-		elif self.type == 'IF' or (self.type == 'ELSE' and not self.parent.prev_eval_result):
+			outer = self._new_var('s')
+			index = self._new_var('i')
+			self._write(indent, outer + ' = replace')
+			self._write(indent, 'for ' + index + ' in Sifter._get_for_range(' + self._compile_segments(element.param_text) + '):')
+			self._write(indent+1, "replace = SifterScope(" + outer + ", None, '#value', " + index + ")")
+			self._compile_content(element, indent+1)
+			self._write(indent, 'replace = ' + outer)
+		elif element.type == 'IF' or element.type == 'ELSE':
 			# IF, ELSE block
-			if self.param == '' or eval(self.param):
-				if not self._display_content(replace): return False
-				self.parent.prev_eval_result = True
+			if element.type == 'ELSE':
+				self._write(indent, 'if not ' + flag + ':')
+				indent += 1
+			if element.param == '':
+				self._compile_content(element, indent)
+				self._write(indent, flag + ' = True')
 			else:
-				self.parent.prev_eval_result = False
-		elif self.type != 'ELSE':
+				self._write(indent, 'if ' + element.param + ':')
+				self._compile_content(element, indent+1)
+				self._write(indent+1, flag + ' = True')
+				self._write(indent, 'else:')
+				self._write(indent+1, flag + ' = False')
+		else:
 			# Other types of block
-			if not self._display_content(replace): return False
-
-		return True
+			self._compile_content(element, indent)
 
-	def _display_tree(self, max_length=20, tabs=''):
+	def compile(self, template, element=None):
 		"""
-		Displays template structure as a tree
+		Compiles template into render function
 		
-		@param	int		max_length  Number of characters to display text
-		@param	string	tabs        Tab characters
+		@return	function	Render function
+		@param	object	template  Parsed template object
+		@param	object	element   Element to compile instead of whole template
 		"""
-		if self.type != '':
-			sys.stdout.write(tabs + "[" + self.type)
-			if self.param != '': sys.stdout.write('(' + str(self.param) + ')')
-			sys.stdout.write("]\n")
-		else:
-			sys.stdout.write(tabs + "[TEMPLATE:" + self.template.template_file + "]\n")
+		self.lines = ['def render(replace):']
+		self.constants = {}
+		self._compile_content(element or template.contents, 1)
+		if not [line for line in self.lines if line.lstrip().startswith('yield ')]:
+			self._write(1, "yield ''")
 
-		for content in self.contents:
-			if content.__class__ is SifterElement:
-				content._display_tree(max_length, tabs + "\t")
-			elif content.__class__ is SifterTemplate:
-				content._display_tree(max_length, tabs + "\t")
-			else:
-				content = re.sub(r'[\r\n]', ' ', content)
-				sys.stdout.write(tabs + "\t[TEXT:" + content[0:max_length] + "]\n")
+		namespace = {'Sifter': Sifter, 'SifterScope': SifterScope, 're': re, 'types': types}
+		namespace.update(self.constants)
+		filename = template.template_file + ('#' + element.param if element else '')
+		exec(compile("\n".join(self.lines) + "\n", '<' + SIFTER_PACKAGE + ':' + filename + '>', 'exec'), namespace)
 
+		return namespace['render']
 
-class SifterTemplate:
+
+class SifterCache:
 	"""
-	Template control class
+	Compiled template cache class
 	
 	@package	Sifter
 	"""
 
 	######## Constructor
-	def __init__(self, parent, template_file='', embed_flag=0, nobreak_flag=0):
+	def __init__(self, size=SIFTER_CACHE_SIZE):
 		"""
-		Creates new SifterTemplate object
+		Creates new SifterCache object
 		
 		@return	object
-		@param	object	parent         Parent object
-		@param	string	template_file  Path to template file
-		@param	int		embed_flag     Embed flag
-		@param	int		nobreak_flag   No-break flag
+		@param	int		size  Maximum number of templates to hold
 		"""
 
 		######## Members
 		##
-		# Holds top level object
-		# 
-		# @var	object
-		##
-		self.top = None
-
-		##
-		# Holds template object
-		# 
-		# @var	object
-		##
-		self.template = None
-
-		##
-		# Holds parent object
-		# 
-		# @var	object
-		##
-		self.parent = None
-
-		##
-		# Holds child objects
-		# 
-		# @var	object
-		##
-		self.contents = None
-
-		##
-		# Path to template file
-		# 
-		# @var	string
-		##
-		self.template_file = ''
-
-		##
-		# Path to directory includes template file
-		# 
-		# @var	string
-		##
-		self.dir_path = ''
-
-		##
-		# File pointer of template file
-		# 
-		# @var	resource
-		##
-		self.fp = None
-
-		##
-		# Buffer
-		# 
-		# @var	string
-		##
-		self.buffer = ''
-
-		#
-		# Buffer size
+		# Maximum number of templates to hold
 		# 
 		# @var	int
 		##
-		self.buffer_size = 0
+		self.size = size
 
 		##
-		# Line number in currently reading file
+		# Holds cached templates
 		# 
-		# @var	int
+		# @var	array
 		##
-		self.reading_line = 0
+		self.entries = {}
 
 		##
-		# Flag of preserving spaces in the line that includes control tags only
+		# Counter of accesses to decide least recently used template
 		# 
-		# @var	bool
+		# @var	int
 		##
-		self.preserve_spaces = False
+		self.tick = 0
 
 		##
-		# Embed flag
+		# Keys of cached templates which depend on each file, keyed by real path of the file
 		# 
-		# @var	int
+		# @var	array
 		##
-		self.embed_flag = 0
+		self.dependents = {}
 
 		##
-		# No-break flag
+		# Lock for accesses from multiple threads
 		# 
-		# @var	int
+		# @var	object
 		##
-		self.nobreak_flag = 0
-
-		if not parent: return None
-
-		if parent.__class__ is Sifter or not parent._get_top():
-			self.top = parent
-			self.parent = None
-		else:
-			self.top = parent._get_top()
-			self.parent = parent
-
-		self.buffer_size = self.top._get_buffer_size()
-		self._set_template_file(template_file)
+		self.lock = threading.Lock()
 
-		self.embed_flag   = embed_flag
-		self.nobreak_flag = nobreak_flag
-
-	######## Methods
-	def _get_top(self):
+	######## Static methods
+	@staticmethod
+	def _stat(files):
 		"""
-		Returns reference to top level object
+		Returns modification times and sizes of files
 		
-		@return	object	Reference to top level object
+		@return	tuple	Modification times and sizes, or None if some file does not exist
+		@param	array	files  Paths to files
 		"""
-		return self.top
+		stats = []
+		for file_ in files:
+			try:
+				stat = os.stat(file_)
+			except OSError:
+				return None
+			stats.append((stat.st_mtime, stat.st_size))
 
-	def _get_template(self):
-		"""
-		Returns reference to template object
-		
-		@return	object	Reference to template object
-		"""
-		return self.template
+		return tuple(stats)
 
-	def _get_parent(self):
+	######## Methods
+	def get(self, key):
 		"""
-		Returns reference to parent object
+		Returns cached template if it is not modified
 		
-		@return	object	Reference to parent object
+		@return	object	Cached template, or None
+		@param	mixed	key  Key of template
+		"""
+		self.lock.acquire()
+		try:
+			entry = self.entries.get(key)
+		finally:
+			self.lock.release()
+
+		if entry is None:
+			return None
+		stats = self._stat(entry[1])
+		if stats != entry[2]:
+			for i in range(len(entry[1])):
+				if stats is None or stats[i] != entry[2][i]:
+					self.invalidate(entry[1][i])
+			self.remove(key)
+			return None
+
+		self.lock.acquire()
+		try:
+			self.tick += 1
+			entry[3] = self.tick
+		finally:
+			self.lock.release()
+
+		return entry[0]
+
+	def set(self, key, template):
+		"""
+		Stores parsed template
+		
+		@param	mixed	key       Key of template
+		@param	object	template  Parsed template object
 		"""
-		return self.parent
+		if self.size <= 0:
+			return
 
-	def _set_template_file(self, template_file):
-		"""
-		Specifies path to template file
+		files = []
+		template._get_files(files)
+		stats = self._stat(files)
+		if stats is None:
+			return
+
+		self.lock.acquire()
+		try:
+			self._remove(key)
+			self.tick += 1
+			self.entries[key] = [template, files, stats, self.tick]
+			for file_ in files:
+				self.dependents.setdefault(os.path.realpath(file_), {})[key] = True
+			while len(self.entries) > self.size:
+				self._remove(min(self.entries.keys(), key=lambda name: self.entries[name][3]))
+		finally:
+			self.lock.release()
+
+	def _remove(self, key):
+		"""
+		Removes cached template and its dependencies while lock is acquired
 		
-		@param	string	template_file  Path to template file
+		@param	mixed	key  Key of template
 		"""
-		self.template_file = template_file
-		self._set_dir_path(template_file)
+		entry = self.entries.pop(key, None)
+		if entry is None:
+			return
 
-	def _get_template_file(self):
+		for file_ in entry[1]:
+			path = os.path.realpath(file_)
+			keys = self.dependents.get(path)
+			if keys is not None:
+				keys.pop(key, None)
+				if not keys:
+					del self.dependents[path]
+
+	def remove(self, key):
 		"""
-		Returns path to template file
+		Removes cached template
 		
-		@return	string	Path to template file
+		@param	mixed	key  Key of template
 		"""
-		return self.template_file
+		self.lock.acquire()
+		try:
+			self._remove(key)
+		finally:
+			self.lock.release()
 
-	def _set_dir_path(self, template_file):
+	def invalidate(self, template_file):
 		"""
-		Specifies path to directory includes template file
+		Removes cached templates which include specified file
 		
 		@param	string	template_file  Path to template file
 		"""
-		matches = re.search(r'^(.*)\/', template_file)
-		if matches:
-			self.dir_path = matches.group(1)
-		else:
-			self.dir_path = '.'
+		self.lock.acquire()
+		try:
+			for key in self.dependents.get(os.path.realpath(template_file), {}).keys():
+				self._remove(key)
+		finally:
+			self.lock.release()
 
-	def _get_dir_path(self):
+	def clear(self):
 		"""
-		Returns path to directory includes template file
+		Removes all cached templates
 		
-		@return	string	Path to directory includes template file
 		"""
-		return self.dir_path
+		self.lock.acquire()
+		try:
+			self.entries = {}
+			self.dependents = {}
+		finally:
+			self.lock.release()
 
-	def _set_preserve_spaces_flag(self, flag):
-		"""
-		Preserves spaces in the line that includes control tags only
-		
-		@param	bool	flag  If this parameter is true, spaces in the line that includes control tags only will be preserved
+
+class SifterFragmentCache:
+	"""
+	Output cache class for CACHE blocks
+	
+	Objects which have the same get() and set() methods can be used instead to share outputs between processes.
+	
+	@package	Sifter
 	"""
-		self.preserve_spaces = flag
 
-	def _get_preserve_spaces_flag(self):
+	######## Constructor
+	def __init__(self, size=SIFTER_FRAGMENT_CACHE_SIZE):
 		"""
-		Returns true if spaces in the line that includes control tags only will be preserved
+		Creates new SifterFragmentCache object
 		
-		@return	bool
+		@return	object
+		@param	int		size  Maximum number of outputs to hold
 		"""
-		return self.preserve_spaces
 
-	def _is_recursive(self, template_file):
+		######## Members
+		##
+		# Maximum number of outputs to hold
+		# 
+		# @var	int
+		##
+		self.size = size
+
+		##
+		# Holds outputs, expiration times and access counters
+		# 
+		# @var	array
+		##
+		self.entries = {}
+
+		##
+		# Counter of accesses to decide least recently used output
+		# 
+		# @var	int
+		##
+		self.tick = 0
+
+		##
+		# Lock for accesses from multiple threads
+		# 
+		# @var	object
+		##
+		self.lock = threading.Lock()
+
+	######## Methods
+	def get(self, key):
 		"""
-		Returns True if specified template is included recursively
+		Returns cached output if it is not expired
 		
-		@return	bool
-		@param	string	template_file  Path to template file
+		@return	string	Cached output, or None
+		@param	mixed	key  Key of output
+		"""
+		self.lock.acquire()
+		try:
+			entry = self.entries.get(key)
+			if entry is None:
+				return None
+			if entry[1] is not None and entry[1] <= time.time():
+				del self.entries[key]
+				return None
+
+			self.tick += 1
+			entry[2] = self.tick
+			return entry[0]
+		finally:
+			self.lock.release()
+
+	def set(self, key, value, ttl=None):
+		"""
+		Stores output
+		
+		@param	mixed	key    Key of output
+		@param	string	value  Output string
+		@param	int		ttl    Time to live in seconds, or None if output does not expire (output is not stored if this is 0)
 		"""
-		if self.template_file == template_file:
-			return True
-		elif self.parent:
-			return self.parent.template._is_recursive(template_file)
-		else:
-			return False
+		if self.size <= 0 or (ttl is not None and ttl <= 0):
+			return
 
-	def _increment_file_line(self):
+		self.lock.acquire()
+		try:
+			self.tick += 1
+			self.entries[key] = [value, (time.time() + ttl) if ttl is not None else None, self.tick]
+			while len(self.entries) > self.size:
+				del self.entries[min(self.entries.keys(), key=lambda name: self.entries[name][2])]
+		finally:
+			self.lock.release()
+
+	def remove(self, key):
 		"""
-		Counts up line number in currently reading file
+		Removes cached output
 		
+		@param	mixed	key  Key of output
 		"""
-		self.reading_line += 1
+		self.lock.acquire()
+		try:
+			if key in self.entries:
+				del self.entries[key]
+		finally:
+			self.lock.release()
 
-	def _get_reading_line(self):
+	def clear(self):
 		"""
-		Returns line number in currently reading file
+		Removes all cached outputs
 		
-		@return	int	Line number in currently reading file
 		"""
-		return self.reading_line
+		self.lock.acquire()
+		try:
+			self.entries = {}
+		finally:
+			self.lock.release()
 
-	def _read_line(self):
+
+class SifterFileCache:
+	"""
+	Parsed template cache class which stores templates in files
+	
+	Cache files are loaded with cPickle, so the directory must not be writable by untrusted users.
+	
+	@package	Sifter
+	"""
+
+	######## Constructor
+	def __init__(self, dir_path):
 		"""
-		Reads template file
+		Creates new SifterFileCache object
 		
-		@return	bool
+		@return	object
+		@param	string	dir_path  Path to directory to store cache files
 		"""
-		if self.fp:
-			self.buffer = self.fp.readline(self.buffer_size)
-			if self.buffer:
-				self._increment_file_line()
-				self._set_preserve_spaces_flag(False)
-				return True
 
-		return False
+		######## Members
+		##
+		# Path to directory to store cache files
+		# 
+		# @var	string
+		##
+		self.dir_path = dir_path
 
-	def _parse(self):
+	######## Methods
+	def _get_path(self, key):
 		"""
-		Reads and parses template file
+		Returns path to cache file
 		
-		@return	bool
+		@return	string	Path to cache file
+		@param	mixed	key  Key of template
 		"""
-		if not self.contents:
-			self.contents = SifterElement(self, '', '', self.embed_flag, self.nobreak_flag)
-
-		self.fp = open(self.template_file, 'rU')
-		if not self.fp:
-			sys.stdout.write(SIFTER_PACKAGE + ": Cannot open file '" + self.template_file + "'.\n")
-			return False
+		return os.path.join(self.dir_path, hashlib.md5(repr(key)).hexdigest() + '.cache')
 
-		if not self.contents._parse():
-			self.fp.close()
-
-			if not self.parent:
-				sys.stdout.write(SIFTER_PACKAGE + ": Error(s) occurred while parsing file '" + self.template_file + "'.\n")
-				sys.stdout.write(SIFTER_PACKAGE + ": " + str(self._get_reading_line()) + " lines have been read.\n")
-
-			return False
-
-		self.fp.close()
-		return True
-
-	def _display(self, replace):
+	def get(self, key):
 		"""
-		Applys template and displays
+		Returns stored template if it is stored by the same version and is not modified
 		
-		@return	string
-		@param	array	replace  Array of replacement
+		@return	object	Stored template, or None
+		@param	mixed	key  Key of template
 		"""
-		return self.contents._display(replace)
+		try:
+			fp = open(self._get_path(key), 'rb')
+		except IOError:
+			return None
+
+		try:
+			try:
+				entry = cPickle.load(fp)
+			except Exception:
+				return None
+		finally:
+			fp.close()
+
+		if type(entry) is not types.TupleType or len(entry) != 5 or entry[0] != SIFTER_VERSION or entry[1] != key:
+			return None
+		if SifterCache._stat(entry[2]) != entry[3]:
+			return None
+
+		return entry[4]
 
-	def _display_tree(self, max_length=20, tabs=''):
+	def set(self, key, template):
 		"""
-		Displays template structure as a tree
+		Stores parsed template
 		
-		@return	bool
-		@param	int		max_length  Number of characters to display text
-		@param	string	tabs        Tab characters
-		"""
-		return self.contents._display_tree(max_length, tabs)
+		@param	mixed	key       Key of template
+		@param	object	template  Parsed template object
+		"""
+		files = []
+		template._get_files(files)
+		files = [os.path.realpath(file_) for file_ in files]
+		stats = SifterCache._stat(files)
+		if stats is None:
+			return
 
-	def _raise_error(self, script_line=0, line=0, error=''):
+		path = self._get_path(key)
+		temp = path + '.' + str(os.getpid()) + '.' + str(id(template))
+		try:
+			if not os.path.isdir(self.dir_path):
+				os.makedirs(self.dir_path)
+
+			fp = open(temp, 'wb')
+			try:
+				cPickle.dump((SIFTER_VERSION, key, files, stats, template), fp, cPickle.HIGHEST_PROTOCOL)
+			finally:
+				fp.close()
+
+			if os.name == 'nt' and os.path.exists(path):
+				os.remove(path)
+			os.rename(temp, path)
+		except (IOError, OSError, cPickle.PicklingError):
+			if os.path.exists(temp):
+				os.remove(temp)
+
+	def remove(self, key):
 		"""
-		Displays syntax error
+		Removes stored template
 		
-		@param	int		script_line  Line number in this script
-		@param	int		line         Line number in currently reading file
-		@param	string	error        Error string
+		@param	mixed	key  Key of template
 		"""
-		file_ = self._get_template_file()
-		line = line if line else self._get_reading_line()
-		error = error if error else 'Syntax error'
-		sys.stdout.write(SIFTER_PACKAGE)
-		if SIFTER_DEBUG:
-			if script_line != 0:
-				sys.stdout.write("(%(script_line)s)" % locals())
-		sys.stdout.write(": %(error)s in %(file_)s on line %(line)s." % locals())
-		sys.stdout.write("\n")
+		try:
+			os.remove(self._get_path(key))
+		except OSError:
+			pass
 
 
 class Sifter:
@@ -854,12 +2718,15 @@ class Sifter:
 #!!	attr_reader :capture_result, :reading_line
 
 	######## Constructor
-	def __init__(self, size=None):
+	def __init__(self, size=None, cache=True, compile_mode=False, cache_dir=None):
 		"""
 		Creates new SifterTemplate object
 		
 		@return	bool
-		@param	int		size  Buffer size in bytes
+		@param	int		size          Buffer size in bytes (not used)
+		@param	bool	cache         If this parameter is True, parsed templates are shared through process-wide cache
+		@param	bool	compile_mode  If this parameter is True, templates are compiled into Python functions
+		@param	string	cache_dir     Path to directory to store parsed templates for other processes, or None
 		"""
 
 		######## Members
@@ -892,12 +2759,19 @@ class Sifter:
 		self.result = ''
 
 		##
-		# Buffer size in bytes
+		# Buffer size in bytes (not used since template files are read at once)
 		# 
 		# @var	int
 		##
 		self.buffer_size = 2048
 
+		##
+		# Output buffer size in bytes
+		# 
+		# @var	int
+		##
+		self.output_buffer_size = 8192
+
 		##
 		# Holds replacements
 		# 
@@ -905,26 +2779,66 @@ class Sifter:
 		##
 		self.replace_vars = {}
 
+		##
+		# Names of replacements whose HTML entities are converted on output
+		# 
+		# @var	array
+		##
+		self.escape_vars = {}
+
+		##
+		# Holds parsed templates
+		# 
+		# @var	object
+		##
+		self.cache = SIFTER_TEMPLATE_CACHE if cache else None
+
+		##
+		# Holds outputs of CACHE blocks, or None to render them every time
+		# 
+		# @var	object
+		##
+		self.fragment_cache = SIFTER_FRAGMENT_CACHE
+
+		##
+		# Stores parsed templates in files
+		# 
+		# @var	object
+		##
+		self.file_cache = SifterFileCache(cache_dir) if cache_dir else None
+
+		##
+		# Collects error messages of parsing instead of displaying them if this is an array
+		# 
+		# @var	array
+		##
+		self.errors = None
+
+		##
+		# Profiler which measures time to render each block, or None
+		# 
+		# @var	object
+		##
+		self.profiler = None
+
+		##
+		# Template syntax
+		# 
+		# @var	object
+		##
+		self.syntax = SIFTER_DEFAULT_SYNTAX
+
+		##
+		# Compile mode flag
+		# 
+		# @var	bool
+		##
+		self.compile_mode = compile_mode
+
 		if size is not None:
 			self.buffer_size = size
 
 	######## Methods
-	def _append_result(self, str):
-		"""
-		Appends result
-		
-		@param	str  String
-		"""
-		self.result += str
-
-	def _get_buffer_size(self):
-		"""
-		Returns buffer size in bytes
-		
-		@return	resource	Buffer size in bytes
-		"""
-		return self.buffer_size
-
 	def _get_var(self, name):
 		"""
 		Returns replacement specified by name
@@ -941,26 +2855,88 @@ class Sifter:
 		@return	bool
 		@param	string	template_file  Path to template file
 		"""
+		key = (os.path.realpath(template_file), self.syntax.key)
+		if self.cache:
+			self.contents = self.cache.get(key)
+			if self.contents:
+				return True
+
+		if self.file_cache:
+			self.contents = self.file_cache.get(key)
+			if self.contents:
+				if self.cache:
+					self.cache.set(key, self.contents)
+				return True
+
 		if not self.contents:
 			self.contents = SifterTemplate(self, template_file)
 		else:
 			self.contents.template_file = template_file
 
-		return self.contents._parse()
+		if not self.contents._parse():
+			return False
+
+		self.contents._release()
+		if self.cache:
+			self.cache.set(key, self.contents)
+		if self.file_cache:
+			self.file_cache.set(key, self.contents)
+
+		return True
 
-	def _set_loop_count(self, replace):
+	def _display(self, replace_vars=None, block=None):
 		"""
-		Set loop count value
-		
-		@param	array	replace  Array of replacement
+		Applys parsed template to replacements
 		
+		@return	generator	Output strings
+		@param	array	replace_vars  Array of replacements which override replacements set up, or None
+		@param	string	block         Name of block to apply instead of whole template, or None
+		"""
+		if replace_vars is None:
+			replace = SifterScope(None, self.replace_vars, '', None, self.escape_vars)
+		else:
+			# Replacements are looked up from the outermost row, so the array precedes replacements set up
+			replace = SifterScope(SifterScope(None, replace_vars, '', None, True), self.replace_vars, '', None, self.escape_vars)
+
+		replace.state['fragment_cache'] = self.fragment_cache
+
+		if block is not None:
+			if self.profiler is not None:
+				replace.state['profiler'] = self.profiler
+				return self.contents._get_block(block)._display(replace)
+			elif self.compile_mode:
+				return self.contents._compile_block(block)(replace)
+			else:
+				return self.contents._get_block(block)._display(replace)
+
+		if self.profiler is not None:
+			replace.state['profiler'] = self.profiler
+			return self.contents._display(replace)
+		elif self.compile_mode:
+			return self.contents._compile()(replace)
+		else:
+			return self.contents._display(replace)
+
+	def _write_result(self, fileobj, buffer_size, block=None):
 		"""
-		if type(replace) is not types.DictType: return
-		for key in replace.keys():
-			if type(replace[key]) is types.ListType and len(replace[key]) > 0:
-				replace['#' + key + '_count'] = len(replace[key])
-				for i in range(0, len(replace[key])):
-					self._set_loop_count(replace[key][i])
+		Writes output strings into file-like object through buffer
+		
+		@param	object	fileobj      Writable file-like object
+		@param	int		buffer_size  Output is written each time this number of bytes is buffered
+		@param	string	block        Name of block to apply instead of whole template, or None
+		"""
+		buffer = []
+		length = 0
+		for content in self._display(None, block):
+			buffer.append(content)
+			length += len(content)
+			if length >= buffer_size:
+				fileobj.write(''.join(buffer))
+				buffer = []
+				length = 0
+
+		if buffer:
+			fileobj.write(''.join(buffer))
 
 	def set_control_tag(self, begin_tag, end_tag, escape=True):
 		"""
@@ -970,15 +2946,11 @@ class Sifter:
 		@param	string	end     Control tag characters (end)
 		@param	bool	escape  If this parameter is True, meta characters are escaped
 		"""
-		global SIFTER_CONTROL_TAG_BGN, SIFTER_CONTROL_TAG_END, SIFTER_CONTROL_PATTERN
-
 		if escape:
 			begin_tag = re.sub(r'([.*+?^\$\\|()\[\]])', r'\\\1', begin_tag)
 			end_tag   = re.sub(r'([.*+?^\$\\|()\[\]])', r'\\\1', end_tag  )
 
-		SIFTER_CONTROL_TAG_BGN = begin_tag
-		SIFTER_CONTROL_TAG_END = end_tag  
-		SIFTER_CONTROL_PATTERN = '^(.*?)(' + begin_tag + SIFTER_CONTROL_EXPRESSION + end_tag + ')(.*)$'
+		self.syntax = SifterSyntax(begin_tag, end_tag, self.syntax.replace_tag_bgn, self.syntax.replace_tag_end)
 
 	def set_replace_tag(self, begin_tag, end_tag, escape=True):
 		"""
@@ -988,26 +2960,24 @@ class Sifter:
 		@param	string	end     Replace tag characters (end)
 		@param	bool	escape  If this parameter is True, meta characters are escaped
 		"""
-		global SIFTER_REPLACE_TAG_BGN, SIFTER_REPLACE_TAG_END, SIFTER_REPLACE_PATTERN
-
 		if escape:
 			begin_tag = re.sub(r'([.*+?^\$\\|()\[\]])', r'\\\1', begin_tag)
 			end_tag   = re.sub(r'([.*+?^\$\\|()\[\]])', r'\\\1', end_tag  )
 
-		SIFTER_REPLACE_TAG_BGN = begin_tag
-		SIFTER_REPLACE_TAG_END = end_tag  
-		SIFTER_REPLACE_PATTERN = begin_tag + SIFTER_REPLACE_EXPRESSION + end_tag
+		self.syntax = SifterSyntax(self.syntax.control_tag_bgn, self.syntax.control_tag_end, begin_tag, end_tag)
 
 	def set_var(self, name, value, convert_html=True):
 		"""
 		Sets up replacements
 		
 		@param	string	name          Name of variable
-		@param	mixed	value         Array or string
+		@param	mixed	value         Array, string, or callable which returns value when it is referred first
 		@param	bool	convert_html  If this parameter is True, HTML entities are converted
 		"""
 		if convert_html:
-			value = Sifter._convert_html_entities(value)
+			self.escape_vars[name] = True
+		elif name in self.escape_vars:
+			del self.escape_vars[name]
 
 		self.replace_vars[name] = value
 
@@ -1022,8 +2992,11 @@ class Sifter:
 		if type(self.replace_vars[name]) is not types.ListType:
 			return
 
-		if convert_html:
+		if convert_html and name not in self.escape_vars:
 			value = Sifter._convert_html_entities(value)
+		elif not convert_html and name in self.escape_vars:
+			self.replace_vars[name] = Sifter._convert_html_entities(self.replace_vars[name])
+			del self.escape_vars[name]
 
 		self.replace_vars[name].append(value)
 
@@ -1042,15 +3015,200 @@ class Sifter:
 
 		if self._parse(template_file):
 			if self.contents:
-				self._set_loop_count(self.replace_vars)
-				if self.contents._display(self.replace_vars):
-					if self.capture_result:
-						return self.result
-					else:
-						return True
+				if self.capture_result:
+					self.result = ''.join(self._display())
+					return self.result
+				else:
+					self._write_result(sys.stdout, self.output_buffer_size)
+					return True
+
+		return False
+
+	def display_block(self, template_file, name, capture_result=False):
+		"""
+		Displays content of BLOCK block specified by name without the rest of template
+		
+		Variables of LOOP blocks which enclose the block are not set.
+		
+		@return	bool
+		@param	string	template_file   Path to template file
+		@param	string	name            Name of block
+		@param	bool	capture_result  If this parameter is True, does not display but returns string
+		"""
+		self.capture_result = capture_result
+
+		self.contents = None
+		self.result = ''
+
+		if self._parse(template_file):
+			if self.contents and self.contents._get_block(name):
+				if self.capture_result:
+					self.result = ''.join(self._display(None, name))
+					return self.result
+				else:
+					self._write_result(sys.stdout, self.output_buffer_size, name)
+					return True
+
+		return False
+
+	def render_to(self, fileobj, template_file, buffer_size=None):
+		"""
+		Writes content into file-like object
+		
+		@return	bool
+		@param	object	fileobj        Writable file-like object
+		@param	string	template_file  Path to template file
+		@param	int		buffer_size    Output is written each time this number of bytes is buffered
+		"""
+		self.capture_result = False
+
+		self.contents = None
+		self.result = ''
+
+		if self._parse(template_file):
+			if self.contents:
+				self._write_result(fileobj, buffer_size if buffer_size is not None else self.output_buffer_size)
+				return True
+
+		return False
+
+	def render_iter(self, template_file, replace_vars=None):
+		"""
+		Returns iterator that yields output strings as they are rendered
+		
+		@return	mixed	Iterator of output strings, or False if template has errors
+		@param	string	template_file  Path to template file
+		@param	array	replace_vars   Array of replacements which override replacements set up only in this rendering (HTML entities are converted)
+		"""
+		self.contents = None
+		self.result = ''
+
+		if self._parse(template_file):
+			if self.contents:
+				return self._display(replace_vars)
+
+		return False
+
+	def render_many(self, template_file, replace_vars_list, processes=None, chunksize=1, ordered=True):
+		"""
+		Renders template for each array of replacements across pool of processes
+		
+		Template is parsed once in this process, and the parsed template is sent to each worker process.
+		Replacements set up by set_var() are shared by all outputs, and each array
+		of replacements overrides them. HTML entities of values in the arrays are converted.
+		
+		@return	mixed	Iterator of output strings (pairs of index and output string if ordered is False), or False if template has errors
+		@param	string	template_file      Path to template file
+		@param	object	replace_vars_list  Iterable of arrays of replacements
+		@param	int		processes          Number of worker processes (defaults to number of CPUs, 1 renders in this process)
+		@param	int		chunksize          Number of arrays of replacements sent to worker at once
+		@param	bool	ordered            If this parameter is False, outputs are yielded as they are completed
+		"""
+		self.contents = None
+		self.result = ''
+
+		if self._parse(template_file):
+			if self.contents:
+				return self._render_many(replace_vars_list, processes, chunksize, ordered)
 
 		return False
 
+	def _render_many(self, replace_vars_list, processes, chunksize, ordered):
+		"""
+		Called by function render_many()
+		
+		@return	generator	Output strings, or pairs of index and output string
+		@param	object	replace_vars_list  Iterable of arrays of replacements
+		@param	int		processes          Number of worker processes
+		@param	int		chunksize          Number of arrays of replacements sent to worker at once
+		@param	bool	ordered            If this parameter is False, outputs are yielded as they are completed
+		"""
+		if processes == 1:
+			for index, replace_vars in enumerate(replace_vars_list):
+				result = ''.join(self._display(replace_vars))
+				if ordered:
+					yield result
+				else:
+					yield (index, result)
+			return
+
+		import multiprocessing
+
+		pool = multiprocessing.Pool(processes, _sifter_init_worker, (
+			self.contents, self.compile_mode, self.replace_vars, self.escape_vars
+		))
+		try:
+			if ordered:
+				for result in pool.imap(_sifter_render_worker, enumerate(replace_vars_list), chunksize):
+					yield result[1]
+			else:
+				for result in pool.imap_unordered(_sifter_render_worker, enumerate(replace_vars_list), chunksize):
+					yield result
+			pool.close()
+		finally:
+			pool.terminate()
+			pool.join()
+
+	def compile_dir(self, dir_path, pattern='*.tmpl', processes=None):
+		"""
+		Parses all template files in directory tree and stores them into cache directory
+		
+		@return	array	Arrays of error messages keyed by path to template file which has errors
+		@param	string	dir_path   Path to directory
+		@param	string	pattern    Shell-style wildcard of names of template files
+		@param	int		processes  Number of worker processes (defaults to number of CPUs, 1 parses in this process)
+		"""
+		import fnmatch
+
+		items = []
+		for root, dirs, files in os.walk(dir_path):
+			dirs.sort()
+			for name in sorted(fnmatch.filter(files, pattern)):
+				items.append((os.path.join(root, name), self.syntax.key, self.file_cache.dir_path if self.file_cache else None))
+
+		if processes == 1:
+			results = map(_sifter_compile_worker, items)
+		else:
+			import multiprocessing
+
+			pool = multiprocessing.Pool(processes)
+			try:
+				results = pool.map(_sifter_compile_worker, items)
+				pool.close()
+			finally:
+				pool.terminate()
+				pool.join()
+
+		errors = {}
+		for template_file, messages in results:
+			if messages:
+				errors[template_file] = messages
+
+		return errors
+
+	def set_profile(self, flag=True):
+		"""
+		Starts or stops measuring time to render each block
+		
+		Blocks are rendered without compiling while profiling.
+		
+		@param	bool	flag  If this parameter is True, starts new profile
+		"""
+		self.profiler = SifterProfiler() if flag else None
+
+	def display_profile(self, limit=None):
+		"""
+		Displays time to render blocks, sorted by total time
+		
+		@return	bool
+		@param	int		limit  Maximum number of blocks to display
+		"""
+		if self.profiler is None:
+			return False
+
+		self.profiler._display(limit)
+		return True
+
 	def display_tree(self, template_file, max_length=20):
 		"""
 		Displays template structure as a tree
@@ -1070,14 +3228,16 @@ class Sifter:
 
 	######## Static methods
 	@staticmethod
-	def _check_condition(condition):
+	def _check_condition(condition, syntax=None):
 		"""
 		Check condition string
 		
 		@return	string	Parsed condition
 		@param	string	condition  Condition string
+		@param	object	syntax     Template syntax
 		"""
-		elem1 = SIFTER_REPLACE_PATTERN
+		syntax = syntax or SIFTER_DEFAULT_SYNTAX
+		elem1 = syntax.replace_expression
 		elem2 = SIFTER_DECIMAL_EXPRESSION
 		elem3 = r'\'(?:[^\'\\]|\\.)*\''
 		elem4 = r'\((' + elem1 + r'|' + elem3 + r')\s*=~\s*\/((?:[^\/\\]|\\.)+)\/([imsx]*)\)'
@@ -1091,13 +3251,13 @@ class Sifter:
 		else:
 			condition = re.sub(
 				r'(' + elem3 + r')', 
-				lambda matches: Sifter._escape_replace_tags(matches.group(1)), 
+				lambda matches: Sifter._escape_replace_tags(matches.group(1), syntax), 
 				condition
 			)
 			condition = re.sub(
 				elem4, 
 				lambda matches: 
-					're.compile(r\'' + Sifter._escape_replace_tags(matches.group(6)) + '\'' + 
+					're.compile(r\'' + Sifter._escape_replace_tags(matches.group(6), syntax) + '\'' + 
 					(',0' + re.sub(r'(.)', lambda matches: '|re.' + matches.group(1).upper(), matches.group(7)) if matches.group(7) else '') + 
 					').search(' + matches.group(1) + ')',
 				condition
@@ -1108,32 +3268,93 @@ class Sifter:
 				condition
 			)
 
-			return Sifter._unescape_replace_tags(condition)
+			return Sifter._unescape_replace_tags(condition, syntax)
+
+	@staticmethod
+	def _get_for_range(param):
+		"""
+		Returns values of FOR block
+		
+		@return	object	Iterable of values of counter, which are generated one by one
+		@param	string	param  Formatted parameter string
+		"""
+		matches = re.search(r'^(-?\d+),\s*(-?\d+)(?:,\s*(-?\d+))?$', param)
+		if not matches:
+			return []
+
+		matches = (None,) + matches.groups()
+		j = int(matches[1])
+		k = int(matches[2])
+		l = int(matches[3]) if matches[3] else (1 if j<=k else -1)
+		if l > 0:
+			return xrange(j, k+1, l)
+		elif l < 0:
+			return xrange(j, k-1, l)
+		else:
+			return []
+
+	@staticmethod
+	def _parse_fragment_param(param):
+		"""
+		Parses parameter of CACHE block
+		
+		@return	tuple	Pair of names of variables for key and time to live in seconds (None if not specified, 0 if not cached), or None if parameter is invalid
+		@param	string	param  Parameter string, such as "name1, name2, 60"
+		"""
+		names = [name.strip() for name in param.split(',')] if param != '' else []
+		ttl = None
+		if names and names[-1].isdigit():
+			ttl = int(names.pop())
+
+		for name in names:
+			if not re.search(r'^#?[A-Za-z_]\w*$', name):
+				return None
+
+		return (tuple(names), ttl)
+
+	@staticmethod
+	def _compile_condition(condition):
+		"""
+		Compiles condition string parsed by _check_condition() into function
+		
+		@return	function	Function that evaluates condition, or None if condition has syntax error
+		@param	string	condition  Parsed condition string
+		"""
+		try:
+			code = compile('lambda replace: (' + condition + ')', '<' + SIFTER_PACKAGE + ':condition>', 'eval')
+		except SyntaxError:
+			return None
+
+		return eval(code, {'re': re})
 
 	@staticmethod
-	def _escape_replace_tags(str):
+	def _escape_replace_tags(str, syntax=None):
 		"""
 		Escape replace tags
 		
 		@return	string	String that includes escaped replace tags
-		@param	string	str  Source string
+		@param	string	str     Source string
+		@param	object	syntax  Template syntax
 		"""
+		syntax = syntax or SIFTER_DEFAULT_SYNTAX
 		return re.sub(
-			r'(' + SIFTER_REPLACE_TAG_BGN + r')(\\*?' + SIFTER_REPLACE_EXPRESSION + SIFTER_REPLACE_TAG_END + ')', 
+			r'(' + syntax.replace_tag_bgn + r')(\\*?' + SIFTER_REPLACE_EXPRESSION + syntax.replace_tag_end + ')', 
 			r'\1\\\2', 
 			str
 		)
 
 	@staticmethod
-	def _unescape_replace_tags(str):
+	def _unescape_replace_tags(str, syntax=None):
 		"""
 		Unescape replace tags
 		
 		@return	string	String that includes unescaped replace tags
-		@param	string	str  Source string
+		@param	string	str     Source string
+		@param	object	syntax  Template syntax
 		"""
+		syntax = syntax or SIFTER_DEFAULT_SYNTAX
 		return re.sub(
-			r'(' + SIFTER_REPLACE_TAG_BGN + r')\\(.+?' + SIFTER_REPLACE_TAG_END + ')', 
+			r'(' + syntax.replace_tag_bgn + r')\\(.+?' + syntax.replace_tag_end + ')', 
 			r'\1\2', 
 			str
 		)
@@ -1188,7 +3409,7 @@ class Sifter:
 		return ret
 
 	@staticmethod
-	def _embed_values_callback(str, values, verbose):
+	def _embed_values_callback(str, values, verbose, state):
 		"""
 		Called by function _embed_values()
 		
@@ -1196,8 +3417,9 @@ class Sifter:
 		@param	string	str      Source string
 		@param	array	values   Array of values to embed
 		@param	bool	verbose  If this parameter is True, "checked" and "selected" attributes are output verbosely
+		@param	array	state    State of embedding, which holds name of current select element
 		"""
-		global SIFTER_SELECT_NAME
+		select_name = state.get('select_name', '')
 
 		element = ''
 		matches = re.search(r'^<(\/?.+?)\b', str)
@@ -1206,7 +3428,7 @@ class Sifter:
 		if element.lower() == 'input':
 			name = Sifter._get_element_id(str)
 			if name in values:
-				type_ = Sifter._get_attribute(str, 'type')
+				type_ = Sifter._get_attribute(str, 'type') or ''
 				if type_.lower() == 'radio' or type_.lower() == 'checkbox':
 					if Sifter._get_attribute(str, 'value') == values[name]:
 						str = Sifter._set_attribute(str, 'checked', 'checked', verbose)
@@ -1223,12 +3445,12 @@ class Sifter:
 					lambda matches: matches.group(1) + values[name] + matches.group(2), str, 1
 				)
 		elif element.lower() == 'select':
-			if SIFTER_SELECT_NAME == '':
-				SIFTER_SELECT_NAME = re.sub(r'\[\]$', '', Sifter._get_element_id(str), 1)
+			if select_name == '':
+				state['select_name'] = re.sub(r'\[\]$', '', Sifter._get_element_id(str), 1)
 		elif element.lower() == '/select':
-			SIFTER_SELECT_NAME = ''
+			state['select_name'] = ''
 		elif element.lower() == 'option':
-			if SIFTER_SELECT_NAME != '' and values[SIFTER_SELECT_NAME]:
+			if select_name != '' and values[select_name]:
 				value = Sifter._get_attribute(str, 'value')
 				if not value:
 					matches = re.compile(r'<option\b.*?>(.*?)(?:<\/option>|[\r\n])', re.I).search(str);
@@ -1236,8 +3458,8 @@ class Sifter:
 						value = matches.group(1)
 
 				if(
-					(type(values[SIFTER_SELECT_NAME]) is types.ListType and values[SIFTER_SELECT_NAME].find(value) >= 0) or
-					value == values[SIFTER_SELECT_NAME]
+					(type(values[select_name]) is types.ListType and value in values[select_name]) or
+					value == values[select_name]
 				):
 					str = Sifter._set_attribute(str, 'selected', 'selected', verbose)
 				else:
@@ -1248,7 +3470,7 @@ class Sifter:
 		return str
 
 	@staticmethod
-	def _embed_values(str, values, verbose=True):
+	def _embed_values(str, values, verbose=True, state=None):
 		"""
 		Embed value into element of form
 		
@@ -1256,9 +3478,13 @@ class Sifter:
 		@param	resource	str      Reference to source string
 		@param	array		values   Array of values to embed
 		@param	bool		verbose  If this parameter is True, "checked" and "selected" attributes are output verbosely
+		@param	array		state    State of embedding shared by strings in the same EMBED block
 		"""
-		str = re.compile(r'(' + SIFTER_EMBED_EXPRESSION + r')', re.I|re.S).sub(
-			lambda matches: Sifter._embed_values_callback(matches.group(1), values, verbose), 
+		if state is None:
+			state = {}
+
+		str = SIFTER_EMBED_PATTERN.sub(
+			lambda matches: Sifter._embed_values_callback(matches.group(0), values, verbose, state), 
 			str
 		)
 
@@ -1269,54 +3495,16 @@ class Sifter:
 		"""
 		Convert HTML entities
 		
+		@return	mixed	Converted string, or converted copy of array
 		@param	mixed	value  String or array to convert
 		"""
 		if type(value) is types.ListType or type(value) is types.TupleType:
-			for key in range(0, len(value)):
-				value[key] = Sifter._convert_html_entities(value[key])
+			value = [Sifter._convert_html_entities(item) for item in value]
 		elif type(value) is types.DictType:
-			for key in value.iterkeys():
-				value[key] = Sifter._convert_html_entities(value[key])
+			value = dict([(key, Sifter._convert_html_entities(item)) for key, item in value.iteritems()])
 		elif type(value) is types.StringType:
-			value = re.sub(r'\&', '&amp;', value)
-			value = re.sub(r'\"', '&quot;', value)
-			value = re.sub(r'\<', '&lt;', value)
-			value = re.sub(r'\>', '&gt;', value)
-
-		return value
-
-	@staticmethod
-	def _format_callback(value, comma='', options=''):
-		"""
-		Called by function format()
-		
-		@return	string	Formatted value
-		@param	string	value    Value
-		@param	string	comma    If this parameter is set, numeric value will be converted to comma formatted value
-		@param	string	options  Options
-		"""
-		if comma and comma != '':
-			comma = ',0' if not comma[1:].isdigit() else comma
-			value = re.sub(r'^((' + SIFTER_DECIMAL_EXPRESSION + r')?).*', r'\1', value)
-			temp = ('%.*f' % (int(comma[1:]), float('0' + value))).split('.')
-			while 1:
-				matches = re.search(r'(\d)(\d\d\d)(?!\d)', temp[0])
-				if not matches: break
-				temp[0] = matches.group(1) + ',' + matches.group(2)
-			value = '.'.join(temp)
-		elif re.search(r'^' + SIFTER_DECIMAL_EXPRESSION + r'$', value):
-			temp = value.split('.')
-			if len(temp) > 1 and int(temp[1]) == 0: value = temp[0]
-
-		if options and options != '':
-			if options.find('b') >= 0:
-				# Convert linebreaks to "<br />"
-				value = re.sub(r'(\r?\n)', r'<br />\1', value)
-			if options.find('q') >= 0:
-				# Escape quotes, backslashes and linebreaks
-				value = re.sub(r'([\"\'\\]|&quot;)', lambda matches: '\\' + matches.group(1), value)
-				value = re.sub(r'\r', r'\\r', value)
-				value = re.sub(r'\n', r'\\n', value)
+			if SIFTER_HTML_SPECIAL_CHARS.search(value):
+				value = value.replace('&', '&amp;').replace('"', '&quot;').replace('<', '&lt;').replace('>', '&gt;')
 
 		return value
 
@@ -1332,29 +3520,138 @@ class Sifter:
 		@param	string	comma      If this parameter is set, numeric value will be converted to comma formatted value
 		@param	string	options    Options
 		"""
-		if type(replace) is not types.DictType: return ''
+		if type(replace) is not types.DictType and replace.__class__ is not SifterScope: return ''
 
-		value = str(replace[key]) if key in replace else ''
+		return SifterFormatter(key, operation, comma, options)._format(replace)
 
-		if operation and operation != '':
-			value = re.sub(r'^((' + SIFTER_DECIMAL_EXPRESSION + r')?).*', r'\1', value)
-			value = 0 if value == '' else value
-			value = eval(str(value) + operation)
-
-		return Sifter._format_callback(str(value), comma, options)
+	@staticmethod
+	def _tokenize(format, syntax=None):
+		"""
+		Splits format string into literal strings and replace tags
+		
+		@return	array	Literal strings and SifterFormatter objects
+		@param	string	format  Format string
+		@param	object	syntax  Template syntax
+		"""
+		segments = []
+		position = 0
+		for matches in (syntax or SIFTER_DEFAULT_SYNTAX).replace_pattern.finditer(format):
+			if matches.start() > position:
+				segments.append(format[position:matches.start()])
+			segments.append(SifterFormatter(*matches.groups()[0:4]))
+			position = matches.end()
+		if position < len(format):
+			segments.append(format[position:])
+
+		return segments
 
 	@staticmethod
-	def format(format, replace):
+	def format(format, replace, syntax=None):
 		"""
 		Format string
 		
+		Replace tags set by set_replace_tag() are not used unless syntax of the Sifter object is passed,
+		such as Sifter.format(format, replace, sifter.syntax).
+		
 		@return	string	Formatted string
 		@param	string	format   Format string
 		@param	array	replace  Array of replacement
+		@param	object	syntax   Template syntax (default tags if None)
 		"""
-		return re.sub(
-			SIFTER_REPLACE_PATTERN, 
+		return (syntax or SIFTER_DEFAULT_SYNTAX).replace_pattern.sub(
 			lambda matches: 
 				Sifter._format(replace, matches.group(1), matches.group(2), matches.group(3), matches.group(4)), 
 			format
 		)
+
+
+################ Functions for worker processes of Sifter.render_many()
+_sifter_worker = None
+
+def _sifter_init_worker(contents, compile_mode, replace_vars, escape_vars):
+	"""
+	Sets up parsed template in worker process
+	
+	@param	object	contents      Parsed template
+	@param	bool	compile_mode  If this parameter is True, templates are compiled into Python functions
+	@param	array	replace_vars  Replacements shared by all outputs
+	@param	array	escape_vars   Names of replacements whose HTML entities are converted on output
+	"""
+	global _sifter_worker
+
+	_sifter_worker = Sifter(None, False, compile_mode)
+	_sifter_worker.contents = contents
+	_sifter_worker.replace_vars = replace_vars
+	_sifter_worker.escape_vars = escape_vars
+
+def _sifter_render_worker(item):
+	"""
+	Renders template in worker process
+	
+	@return	tuple	Pair of index and output string
+	@param	tuple	item  Pair of index and array of replacements
+	"""
+	return (item[0], ''.join(_sifter_worker._display(item[1])))
+
+def _sifter_compile_worker(item):
+	"""
+	Parses template file in worker process
+	
+	@return	tuple	Pair of path to template file and array of error messages
+	@param	tuple	item  Path to template file, control tag and replace tag characters, and path to cache directory
+	"""
+	template_file, syntax_key, cache_dir = item
+
+	sifter = Sifter(None, False, False, cache_dir)
+	sifter.syntax = SifterSyntax(*syntax_key)
+	sifter.errors = []
+	try:
+		if not sifter._parse(template_file) and not sifter.errors:
+			sifter.errors.append(SIFTER_PACKAGE + ": Error(s) occurred while parsing file '" + template_file + "'.")
+	except (IOError, OSError), e:
+		sifter.errors.append(SIFTER_PACKAGE + ": Cannot open file '" + str(e.filename) + "' while parsing file '" + template_file + "'.")
+
+	return (template_file, sifter.errors)
+
+
+################ Command line interface
+def _sifter_main(argv):
+	"""
+	Runs command given from command line
+	
+	@return	int		Exit status
+	@param	array	argv  Arguments
+	"""
+	import optparse
+
+	parser = optparse.OptionParser(usage='python -m Sifter compile [options] <dir>')
+	parser.add_option('-o', '--cache-dir', dest='cache_dir', help='directory to store parsed templates (default: <dir>/.sifter-cache)')
+	parser.add_option('-p', '--pattern', dest='pattern', default='*.tmpl', help='wildcard of names of template files (default: *.tmpl)')
+	parser.add_option('-j', '--processes', dest='processes', type='int', help='number of worker processes (default: number of CPUs)')
+	options, args = parser.parse_args(argv)
+	if len(args) != 2 or args[0] != 'compile':
+		parser.error('command must be "compile <dir>"')
+
+	dir_path = args[1]
+	if not os.path.isdir(dir_path):
+		parser.error("'" + dir_path + "' is not a directory")
+
+	sifter = Sifter(None, False, False, options.cache_dir or os.path.join(dir_path, '.sifter-cache'))
+	errors = sifter.compile_dir(dir_path, options.pattern, options.processes)
+	for template_file in sorted(errors.keys()):
+		for message in errors[template_file]:
+			sys.stderr.write(message + "\n")
+
+	return 1 if errors else 0
+
+
+################ Global objects
+SIFTER_DEFAULT_SYNTAX = SifterSyntax()
+SIFTER_TEMPLATE_CACHE = SifterCache(SIFTER_CACHE_SIZE)
+SIFTER_FRAGMENT_CACHE = SifterFragmentCache(SIFTER_FRAGMENT_CACHE_SIZE)
+
+
+if __name__ == '__main__':
+	# Classes are imported from module "Sifter" instead of "__main__" so that stored templates can be loaded by other programs
+	import Sifter
+	sys.exit(Sifter._sifter_main(sys.argv[1:]))
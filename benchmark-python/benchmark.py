@@ -0,0 +1,292 @@
+##
+# Benchmark of Sifter
+#
+# Usage:
+#   python benchmark.py [-o results.json] [-c baseline.json] [-n repeat] [--compile] [--sifter dir] [case ...]
+#
+# Each case runs in a fresh process so that peak memory is measured per case.
+# Render times exclude parsing (and compiling in compile mode) for every version.
+##
+
+import json, optparse, os, platform, shutil, subprocess, sys, tempfile, time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+################ Synthetic templates
+def case_loop(dir_path):
+	"""
+	Large LOOP block
+	"""
+	write(dir_path, 'loop.tmpl', (
+		'<table>\n'
+		'<!--@LOOP(rows)-->\n'
+		'<tr class="{#rows_index}"><td>{id}</td><td>{name}</td><td>{note}</td></tr>\n'
+		'<!--@END_LOOP-->\n'
+		'</table>\n'
+	))
+	rows = [{'id': i, 'name': 'name <%d>' % i, 'note': 'note & "%d"' % i} for i in range(20000)]
+	return ('loop.tmpl', {'rows': rows})
+
+def case_nested_if(dir_path):
+	"""
+	Deeply nested IF/ELSE blocks in LOOP block
+	"""
+	depth = 40
+	source = '<!--@LOOP(rows)-->\n'
+	for i in range(depth):
+		source += '<!--@IF({level}>=' + str(i) + ')-->\n' + 'level ' + str(i) + ' {name}\n'
+	for i in range(depth):
+		source += '<!--@ELSE-->\nbelow ' + str(depth-i-1) + '\n<!--@END_IF-->\n'
+	source += '<!--@END_LOOP-->\n'
+	write(dir_path, 'nested_if.tmpl', source)
+	rows = [{'level': str(i % depth), 'name': 'n%d' % i} for i in range(1000)]
+	return ('nested_if.tmpl', {'rows': rows})
+
+def case_long_line(dir_path):
+	"""
+	Template of one long line
+	"""
+	parts = []
+	for i in range(5000):
+		parts.append('<span>{v' + str(i % 50) + '}</span><!--@IF({flag}==\'1\')-->+<!--@ELSE-->-<!--@END_IF-->')
+	write(dir_path, 'long_line.tmpl', ''.join(parts) + '\n')
+	replace = {'flag': '1'}
+	for i in range(50):
+		replace['v' + str(i)] = 'value%d' % i
+	return ('long_line.tmpl', replace)
+
+def case_include(dir_path):
+	"""
+	Many INCLUDE blocks
+	"""
+	write(dir_path, 'header.tmpl', '<header>{title}<!--@INCLUDE(nav.tmpl)--></header>\n')
+	write(dir_path, 'nav.tmpl', '<nav><!--@LOOP(links)--><a href="{url}">{label}</a><!--@END_LOOP--></nav>\n')
+	write(dir_path, 'item.tmpl', '<div>{title} <!--@IF({title}!=\'\')-->ok<!--@END_IF--></div>\n')
+	source = ''
+	for i in range(200):
+		source += '<!--@INCLUDE(header.tmpl)-->\n<!--@INCLUDE(item.tmpl)-->\n'
+	write(dir_path, 'include.tmpl', source)
+	links = [{'url': '/page/%d' % i, 'label': 'Page %d' % i} for i in range(10)]
+	return ('include.tmpl', {'title': 'Title', 'links': links})
+
+def case_embed(dir_path):
+	"""
+	Large form in EMBED block
+	"""
+	source = '<!--@EMBED-->\n<form>\n'
+	for i in range(300):
+		source += '<input type="text" name="text' + str(i) + '" value="">\n'
+		source += '<input type="checkbox" name="check' + str(i) + '" value="on">\n'
+		source += '<select name="select' + str(i) + '">'
+		for j in range(5):
+			source += '<option value="' + str(j) + '">' + str(j) + '</option>'
+		source += '</select>\n'
+		source += '<textarea name="area' + str(i) + '"></textarea>\n'
+	source += '</form>\n<!--@END_EMBED-->\n'
+	write(dir_path, 'embed.tmpl', source)
+	replace = {}
+	for i in range(300):
+		replace['text' + str(i)] = 'text <%d>' % i
+		replace['check' + str(i)] = 'on' if i % 2 else 'off'
+		replace['select' + str(i)] = str(i % 5)
+		replace['area' + str(i)] = 'line1\nline2 %d' % i
+	return ('embed.tmpl', replace)
+
+def case_format(dir_path):
+	"""
+	Heavy formatting of replace tags
+	"""
+	write(dir_path, 'format.tmpl', (
+		'<!--@LOOP(rows)-->\n'
+		'{price,2} {price*1.08,2} {price+100,} {note:b} {price,2:b} {#rows_index+1}\n'
+		'<!--@END_LOOP-->\n'
+	))
+	rows = [{'price': str(1000 + i * 3.75), 'note': 'line %d\nnext' % i} for i in range(10000)]
+	return ('format.tmpl', {'rows': rows})
+
+CASES = ['loop', 'nested_if', 'long_line', 'include', 'embed', 'format']
+
+
+################ Measurement
+def write(dir_path, name, source):
+	"""
+	Writes template file
+	"""
+	fp = open(os.path.join(dir_path, name), 'w')
+	try:
+		fp.write(source)
+	finally:
+		fp.close()
+
+def new_sifter(Sifter, compile_mode, cache=True):
+	"""
+	Creates Sifter object, which may be an older version without compile mode
+	"""
+	try:
+		return Sifter(None, cache, compile_mode)
+	except TypeError:
+		return Sifter()
+
+def prepare(sifter, template_file):
+	"""
+	Parses template file, and compiles it in compile mode, so that only rendering is measured
+	"""
+	sifter.contents = None
+	if not sifter._parse(template_file):
+		raise RuntimeError("failed to parse '" + template_file + "'")
+	if getattr(sifter, 'compile_mode', False):
+		sifter.contents._compile()
+
+def render(sifter):
+	"""
+	Applies parsed template to replacements, which differs between versions
+	"""
+	if hasattr(sifter, '_display'):
+		return ''.join(sifter._display())
+
+	# Versions which render into Sifter.result
+	sifter.capture_result = True
+	sifter.result = ''
+	sifter._set_loop_count(sifter.replace_vars)
+	sifter.contents._display(sifter.replace_vars)
+	return sifter.result
+
+def peak_memory():
+	"""
+	Returns peak resident memory of this process in kilobytes, or None
+	"""
+	try:
+		import resource
+	except ImportError:
+		return None
+
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak / 1024 if sys.platform == 'darwin' else peak
+
+def run_case(name, sifter_dir, repeat, compile_mode):
+	"""
+	Measures one case in this process
+	"""
+	sys.path.insert(0, sifter_dir)
+	import Sifter as module
+
+	dir_path = tempfile.mkdtemp(prefix='sifter-benchmark-')
+	try:
+		template_file, replace = globals()['case_' + name](dir_path)
+		template_file = os.path.join(dir_path, template_file)
+
+		parse_times = []
+		for i in range(repeat):
+			sifter = new_sifter(module.Sifter, compile_mode, False)
+			start = time.time()
+			sifter._parse(template_file)
+			parse_times.append(time.time() - start)
+
+		render_times = []
+		output = ''
+		for i in range(repeat):
+			sifter = new_sifter(module.Sifter, compile_mode, False)
+			for key in replace.keys():
+				sifter.set_var(key, replace[key])
+			prepare(sifter, template_file)
+			start = time.time()
+			output = render(sifter)
+			render_times.append(time.time() - start)
+	finally:
+		shutil.rmtree(dir_path, True)
+
+	render_time = min(render_times)
+	return {
+		'case': name,
+		'parse_time': min(parse_times),
+		'render_time': render_time,
+		'output_bytes': len(output),
+		'throughput': (len(output) / render_time / 1048576.0) if render_time > 0 else None,
+		'peak_memory': peak_memory(),
+	}
+
+def compare(results, baseline_file):
+	"""
+	Prints ratios of times to baseline results
+	"""
+	fp = open(baseline_file)
+	try:
+		baseline = dict([(result['case'], result) for result in json.load(fp)['results']])
+	finally:
+		fp.close()
+
+	print
+	print '%-12s %12s %12s' % ('vs baseline', 'parse', 'render')
+	for result in results:
+		base = baseline.get(result['case'])
+		if base is None:
+			continue
+		ratios = []
+		for key in ('parse_time', 'render_time'):
+			ratios.append('%11.2fx' % (result[key] / base[key]) if base[key] else '%12s' % '-')
+		print '%-12s %s %s' % (result['case'], ratios[0], ratios[1])
+
+def main():
+	parser = optparse.OptionParser(usage='python benchmark.py [options] [case ...]')
+	parser.add_option('-o', '--output', dest='output', help='file to save results as JSON')
+	parser.add_option('-c', '--compare', dest='compare', help='JSON file of results to compare with')
+	parser.add_option('-n', '--repeat', dest='repeat', type='int', default=5, help='number of runs per case (default: 5)')
+	parser.add_option('--compile', dest='compile_mode', action='store_true', default=False, help='render in compile mode')
+	parser.add_option('--sifter', dest='sifter_dir', default=os.path.join(BENCHMARK_DIR, '..'), help='directory which includes Sifter.py')
+	parser.add_option('--case', dest='case', help=optparse.SUPPRESS_HELP)
+	options, args = parser.parse_args()
+
+	sifter_dir = os.path.abspath(options.sifter_dir)
+	if options.case:
+		print json.dumps(run_case(options.case, sifter_dir, options.repeat, options.compile_mode))
+		return 0
+
+	for name in args:
+		if name not in CASES:
+			parser.error("unknown case '" + name + "' (available: " + ', '.join(CASES) + ')')
+
+	results = []
+	print '%-12s %10s %10s %12s %10s %10s' % ('case', 'parse(ms)', 'render(ms)', 'output(KB)', 'MB/s', 'peak(KB)')
+	for name in args or CASES:
+		command = [sys.executable, os.path.abspath(__file__), '--case', name, '--repeat', str(options.repeat), '--sifter', sifter_dir]
+		if options.compile_mode:
+			command.append('--compile')
+		process = subprocess.Popen(command, stdout=subprocess.PIPE)
+		output = process.communicate()[0]
+		if process.returncode != 0:
+			sys.stderr.write("case '" + name + "' failed\n")
+			continue
+
+		result = json.loads(output.strip().split('\n')[-1])
+		results.append(result)
+		print '%-12s %10.2f %10.2f %12.1f %10.2f %10s' % (
+			name, result['parse_time'] * 1000, result['render_time'] * 1000, result['output_bytes'] / 1024.0,
+			result['throughput'] or 0, result['peak_memory'] if result['peak_memory'] is not None else '-'
+		)
+
+	sys.path.insert(0, sifter_dir)
+	import Sifter as module
+	report = {
+		'sifter_version': module.SIFTER_VERSION,
+		'python_version': platform.python_version(),
+		'platform': platform.platform(),
+		'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'repeat': options.repeat,
+		'compile_mode': options.compile_mode,
+		'results': results,
+	}
+	if options.output:
+		fp = open(options.output, 'w')
+		try:
+			json.dump(report, fp, indent=2, sort_keys=True)
+		finally:
+			fp.close()
+
+	if options.compare:
+		compare(results, options.compare)
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())